@@ -1,13 +1,43 @@
 import time
-from collections import UserDict
-from datetime import datetime, timedelta
+from collections import UserDict, OrderedDict, defaultdict
+from collections.abc import MutableMapping
+from datetime import date, datetime, timedelta
 from itertools import islice
 import pickle
+import copy
 import os
 import re
 from pathlib import Path
 from random import choice
 from abc import abstractmethod, ABC
+from typing import NamedTuple
+import threading
+from calendar import isleap
+from functools import lru_cache, wraps
+from contextlib import contextmanager, nullcontext, redirect_stdout
+import asyncio
+import heapq
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import inspect
+import io
+import tracemalloc
+import json
+import sqlite3
+import argparse
+import sys
+import csv
+import mmap
+import struct
+import zlib
+import hashlib
+import math
+from bisect import bisect_left, bisect_right, insort
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class PhonebookInterface(ABC):
@@ -20,8 +50,90 @@ class PhonebookInterface(ABC):
     def return_error(self, key, p_or_r, *args, **kwargs):
         pass
 
+    def show_record(self, record):
+        self.return_message('show_all_contact', True, record.name.value)
+        self.return_message('show_all_numbers', True)
+        for phone in record.phones:
+            print(f'{phone};')
+        print(f'----------------\n{self.return_message("show_all_bd", False)}'
+              f'{record.birthday if record.birthday else self.return_message("not_specified", False)}')
+        print(f'----------------\nEmail: ')
+        if record.emails:
+            for email in record.emails:
+                print(f'{email};\n')
+        else:
+            self.return_message('not_specified', True)
+
+    def show_found(self, record):
+        self.return_message('found_in_record', True, record.name.value)
+        self.return_message('show_all_numbers', True)
+        for phone in record.phones:
+            print(f'{phone};')
+        print(f'Email: ')
+        for email in record.emails:
+            print(f'{email};')
+
+
+PLACEHOLDER = re.compile(r'\(\?(\d+)\)')
+
+
+def compile_catalog(commands_dict) -> dict:
+    """
+    Turns every "(?N)" template into a str.format pattern and the number of arguments it takes.
+    Anything that is not a string with placeholders (plain strings, tuples) is kept as is with None.
+    """
+    compiled = {}
+    for section, templates in commands_dict.items():
+        compiled[section] = {}
+        for key, template in templates.items():
+            indexes = [int(index) for index in PLACEHOLDER.findall(template)] if isinstance(template, str) else []
+            if indexes:
+                pattern = PLACEHOLDER.sub(r'{\1}', template.replace('{', '{{').replace('}', '}}'))
+                compiled[section][key] = (pattern, max(indexes) + 1)
+            else:
+                compiled[section][key] = (template, None)
+    return compiled
+
+
+class CatalogLang(PhonebookInterface):
+    """
+    Language backed by a commands_dict catalog, compiled once per catalog.
+    Placeholders without a matching argument are left in the text as they are.
+    """
+    commands_dict = {}
+    compiled = None
+
+    def __init__(self, commands_dict=None):
+        if commands_dict is not None:
+            self.commands_dict = commands_dict
+        self.compiled = compile_catalog(self.commands_dict)
+
+    def get_something(self, something, key, args):
+        pattern, count = self.compiled[something][key]
+        if count is None:
+            return pattern
+        if len(args) < count:
+            args = (*args, *(f'(?{index})' for index in range(len(args), count)))
+        return pattern.format(*args)
+
+    def return_message(self, key, p_or_r: bool, *args, **kwargs):
+        string = self.get_something('messages', key, args)
+        if p_or_r:
+            print(string)
+            return ''
+        else:
+            return string
+
+    def return_error(self, key, p_or_r: bool, *args, **kwargs):
+        string = self.get_something('errors', key, args)
+        if p_or_r:
+            print(string)
+            return ''
+        else:
+            return string
 
-class UkrainianLang(PhonebookInterface):
+
+class UkrainianLang(CatalogLang):
     commands_dict = {
         'messages': {
             'contact_added': '|Контакт (?0) було додано до телефонної книги.|',
@@ -30,13 +142,14 @@ class UkrainianLang(PhonebookInterface):
             'enter_to_proceed': '|Натисніть ENTER, щоб продовжити...|\n',
             'number_updated': '|Номер контакту (?0) було змінено.|',
             'contact_not_found': '|Контакт (?0) не знайдено.|',
+            'did_you_mean': '|Можливо, ви мали на увазі: (?0)?|',
             'empty_phonebook': '|Телефонна книга пуста.|',
             'number_deleted': '|Номер (?0) контакту (?1) було успішно видалено.|',
             'contact_deleted': '|Контакт (?0) було успішно видалено.|',
             'phonebook': '--- Телефонна книга ---',
             'how_much_recs': '|Натисніть ENTER щоб відобразити усі записи.|'
                              '\nАбо введіть, скільки записів відобразити за раз: \n>>>> ',
-            'wrong_recs_count': '|Ви ввели (&0) записів для відображення, '
+            'wrong_recs_count': '|Ви ввели (?0) записів для відображення, '
                                 'але я не можу вивести менше одного.|',
             'show_all_contact': '***\nКонтакт -- (?0);',
             'show_all_numbers': '----------------\nТелефонні номери: ',
@@ -55,6 +168,7 @@ class UkrainianLang(PhonebookInterface):
             'bd_added': '|День народження (?0) задано у контакта (?1).|',
             'no_number_of_days_to_search': '|Не вказана кількість днів для розрахунку.|',
             'search_for_bd': '--- Пошук по контактах з найближчим днем народження ---',
+            'bd_window': '--- Протягом (?0) днів ---',
             'bd_search_result': '|Контакт (?0) народився(-лась) (?1), до його дня народження залишилось (?2) днів.|',
             'clear_phonebook': 'Ви впевнені, що хочете очистити телефонну книгу? (y/n) ',
             'phonebook_cleared': '|Телефонна книга очищена.|',
@@ -64,8 +178,8 @@ class UkrainianLang(PhonebookInterface):
             'help': '---\n'
                     'Доступні команди:\n'
                     'add contact <name> <phone> - додати запис;\n'
-                    'show all - побачити усі доступні записи;\n'
-                    'show near bd <days from today to> - знайти найближчі дні народження;\n'
+                    'show all [<prefix>* | <from>..<to>] - побачити записи за абеткою;\n'
+                    'show near bd <days from today to> [<days> ...] - знайти найближчі дні народження;\n'
                     'update number <name> <old number> <new number> - змінити номер телефона;\n'
                     'append number <name> <new number> - додати додатковий номер телефона;\n'
                     'delete number <name> <number> - видалити номер телефона;\n'
@@ -74,11 +188,16 @@ class UkrainianLang(PhonebookInterface):
                     'delete email <name> <email> - видалити email;\n'
                     'add birthday <name> <birthday "dd.mm.yyyy"> - додати день народження;\n'
                     'help - побачити цю довідку;\n'
+                    'stats - час і пам\'ять по командах (з --profile), фільтр Блума (з --bloom);\n'
                     'hello, hi - вітання;\n'
                     'delete contact <name> - видалення контакта;\n'
                     'find - пошук контакта;\n'
+                    'find~ <name> - пошук схожих імен, якщо не пам\'ятаєте точного написання;\n'
                     'clear, cls - очистити вікно;\n'
                     'clear phonebook - очистити телефонну книгу;\n'
+                    'import <file.csv | file.vcf> - імпортувати контакти з CSV або vCard;\n'
+                    '<команда>; <команда>; ... - виконати кілька команд разом: усі або жодної (find - лише останньою);\n'
+                    'begin ... commit - те саме для кількох рядків (rollback - скасувати);\n'
                     'quit, q  - закрити программу;\n---',
             'greeting': '---\nВітаю! Шукаєш інформацію?\nЧим я можу допомогти?\n---',
             'goodnight': '---\nДоброї ночі!\n---',
@@ -87,6 +206,16 @@ class UkrainianLang(PhonebookInterface):
             'goodevening': '---\nДобрий вечір!\n---',
             'welcome': 'І ласкаво прошу до телефонної книги!\n-----',
             'command_is_unknown': '-\n|Введена команда не розпізнана. Спробуйте "help" для довідки.|\n-',
+            'stats_disabled': '|Вимірювання вимкнені. Запустіть програму з --profile.|',
+            'stats_header': 'команда          викликів    час, мс     ЦП, мс   пам., КБ   записів  гістограма, мс',
+            'bloom_stats': '|Фільтр Блума: перевірок (?0), зекономлено пошуків (?1), хибних збігів (?2), '
+                           'ключів (?3), цільова похибка (?4).|',
+            'import_rejected': '|Рядок (?0) відхилено: (?1)|',
+            'import_result': '|Імпортовано контактів: (?0), відхилено рядків: (?1).|',
+            'batch_prompt': '..... ',
+            'batch_applied': '|Пакет із (?0) команд виконано.|',
+            'batch_rolled_back': '|Команда "(?0)" не виконалась, весь пакет скасовано.|',
+            'batch_discarded': '|Пакет скасовано.|',
         },
         'errors': {
             'lang_not_chosen': '|Мова не обрана!|',
@@ -102,35 +231,18 @@ class UkrainianLang(PhonebookInterface):
             'email_already_exists': '-\n|Такий email вже є в телефонній книзі.|\n-',
             'no_email_update_to': '-\n|Здається щось пішло не так.|\n-',
             'this_mail_does_not_exist': '-\n|Ви намагаєтеся змінити неіснуючий email.|\n-',
+            'import_file_not_found': '-\n|Файл для імпорту не знайдено.|\n-',
+            'unsupported_import_format': '-\n|Підтримується імпорт лише з CSV та vCard.|\n-',
+            'import_file_unreadable': '-\n|Файл для імпорту не вдалося прочитати.|\n-',
+            'undecodable_row': '-\n|Рядок не в кодуванні UTF-8.|\n-',
+            'batch_rejected': '-\n|Команду "(?0)" не можна виконати в пакеті, нічого не змінено.|\n-',
+            'batch_invalid': '-\n|Команда "(?0)" має неправильні аргументи, нічого не змінено.|\n-',
 
         },
     }
 
-    def get_something(self, something, key, args, kwargs):
-        string = self.commands_dict[something][key]
-        for i, j in enumerate(args):
-            string = string.replace(f'(?{i})', j)
-
-        return string
-
-    def return_message(self, key, p_or_r: bool, *args, **kwargs):
-        string = self.get_something('messages', key, args, kwargs)
-        if p_or_r:
-            print(string)
-            return ''
-        else:
-            return string
-
-    def return_error(self, key, p_or_r: bool, *args, **kwargs):
-        string = self.get_something('errors', key, args, kwargs)
-        if p_or_r:
-            print(string)
-            return ''
-        else:
-            return string
-
 
-class EnglishLang(PhonebookInterface):
+class EnglishLang(CatalogLang):
     commands_dict = {
         'messages': {
             'contact_added': '|Contact (?0) was added to phonebook.|',
@@ -139,6 +251,7 @@ class EnglishLang(PhonebookInterface):
             'enter_to_proceed': '|Press ENTER to proceed...|\n',
             'number_updated': '|This contacts phone number (?0) updated.|',
             'contact_not_found': '|Contact (?0) not found.|',
+            'did_you_mean': '|Did you mean: (?0)?|',
             'empty_phonebook': '|Phonebook is empty.|',
             'number_deleted': '|Number (?0) of contact (?1) successfully deleted.|',
             'contact_deleted': '|Contact (?0) successfully deleted.|',
@@ -163,6 +276,7 @@ class EnglishLang(PhonebookInterface):
             'bd_added': '|Birthday (?0) added to contact (?1).|',
             'no_number_of_days_to_search': '|No number of days to search.|',
             'search_for_bd': '--- Search for contacts with the upcoming birthday ---',
+            'bd_window': '--- Within (?0) days ---',
             'bd_search_result': '|Contact (?0) was born (?1), until his birthday left (?2) days.|',
             'clear_phonebook': 'Are you sure you want to clear the phonebook? (y/n) ',
             'phonebook_cleared': '|Phonebook cleared.|',
@@ -173,8 +287,8 @@ class EnglishLang(PhonebookInterface):
                 '---\n'
                 'Available commands:\n'
                 'add contact <name> <phone> - adding the record;\n'
-                'show all - view all saved records;\n'
-                'show near bd <days from today to> - finding out about upcoming birthdays;\n'
+                'show all [<prefix>* | <from>..<to>] - view saved records in alphabetical order;\n'
+                'show near bd <days from today to> [<days> ...] - finding out about upcoming birthdays;\n'
                 'update number <name> <old number> <new number> - updating phone number;\n'
                 'append number <name> <new number> - adding additional phone number;\n'
                 'delete number <name> <number> - delete phone number;\n'
@@ -183,11 +297,16 @@ class EnglishLang(PhonebookInterface):
                 'delete email <name> <email> - delete email;\n'
                 'add birthday <name> <birthday "dd.mm.yyyy"> - adding birthday;\n'
                 'help - view this help;\n'
+                'stats - time and memory per command (with --profile), Bloom filter stats (with --bloom);\n'
                 'hello, hi - greetings;\n'
                 'delete contact <name> - deleting the contact;\n'
                 'find - searching for record;\n'
+                'find~ <name> - searching for similar names when unsure of the spelling;\n'
                 'clear, cls - clears the window;\n'
                 'clear phonebook - clears the phonebook;\n'
+                'import <file.csv | file.vcf> - importing contacts from CSV or vCard;\n'
+                '<command>; <command>; ... - run several commands as one batch, all or nothing (find goes last);\n'
+                'begin ... commit - the same over several lines (rollback drops the block);\n'
                 'quit, q  - closing the program;\n---',
             'greeting': '---\nHi, looking for some info?\nHow can I help you?\n---',
             'goodnight': '---\nGoodnight!\n---',
@@ -196,6 +315,16 @@ class EnglishLang(PhonebookInterface):
             'goodevening': '---\nGood evening!\n---',
             'welcome': 'And welcome to the phonebook!\n-----',
             'command_is_unknown': '-\n|Entered command is unknown. Try "help" for more information.|\n-',
+            'stats_disabled': '|Measurements are off. Start the program with --profile.|',
+            'stats_header': 'command            calls   wall, ms    cpu, ms  alloc, KB   records  histogram, ms',
+            'bloom_stats': '|Bloom filter: (?0) checks, (?1) lookups saved, (?2) false positives, '
+                           '(?3) keys, target error rate (?4).|',
+            'import_rejected': '|Row (?0) rejected: (?1)|',
+            'import_result': '|Imported (?0) contacts, rejected (?1) rows.|',
+            'batch_prompt': '..... ',
+            'batch_applied': '|Batch of (?0) commands applied.|',
+            'batch_rolled_back': '|Command "(?0)" failed, the whole batch was rolled back.|',
+            'batch_discarded': '|Batch discarded.|',
 
         },
         'errors': {
@@ -212,33 +341,16 @@ class EnglishLang(PhonebookInterface):
             'email_already_exists': '-\n|The email is already exist in this phonebook.|\n-',
             'no_email_update_to': '-\n|Something went wrong, I guess.|\n-',
             'this_mail_does_not_exist': '-\n|You are trying to change a non-existent email address|\n-',
+            'import_file_not_found': '-\n|The file to import is not found.|\n-',
+            'unsupported_import_format': '-\n|Only CSV and vCard files can be imported.|\n-',
+            'import_file_unreadable': '-\n|The file to import cannot be read.|\n-',
+            'undecodable_row': '-\n|The row is not UTF-8 text.|\n-',
+            'batch_rejected': '-\n|Command "(?0)" cannot run in a batch, nothing was changed.|\n-',
+            'batch_invalid': '-\n|Command "(?0)" has invalid arguments, nothing was changed.|\n-',
 
         },
     }
 
-    def get_something(self, something, key, args, kwargs):
-        string = self.commands_dict[something][key]
-        for i, j in enumerate(args):
-            string = string.replace(f'(?{i})', j)
-
-        return string
-
-    def return_message(self, key, p_or_r: bool, *args, **kwargs):
-        string = self.get_something('messages', key, args, kwargs)
-        if p_or_r:
-            print(string)
-            return ''
-        else:
-            return string
-
-    def return_error(self, key, p_or_r: bool, *args, **kwargs):
-        string = self.get_something('errors', key, args, kwargs)
-        if p_or_r:
-            print(string)
-            return ''
-        else:
-            return string
-
 
 class NoEmailUpdateTo(Exception):
     """
@@ -324,7 +436,65 @@ class ThisMailDoesNotExist(Exception):
     pass
 
 
+class ContactNotFound(Exception):
+    """
+    Raised when there is no contact with the given name, with the closest names as suggestions
+    """
+
+    def __init__(self, name, suggestions=()):
+        super().__init__(name)
+        self.suggestions = list(suggestions)
+
+
+class EmptyPhonebook(Exception):
+    """
+    Raised when the command needs contacts but the phonebook is empty
+    """
+    pass
+
+
+class UnsupportedSnapshot(Exception):
+    """
+    Raised when a binary snapshot has an unknown signature or version
+    """
+    pass
+
+
+class ImportFileNotFound(Exception):
+    """
+    Raised when the file to import does not exist
+    """
+    pass
+
+
+class UnsupportedImportFormat(Exception):
+    """
+    Raised when the file to import is neither CSV nor vCard
+    """
+    pass
+
+
+class ImportFileUnreadable(Exception):
+    """
+    Raised when the file to import cannot be opened or is not a well-formed CSV
+    """
+    pass
+
+
+class UndecodableRow(Exception):
+    """
+    Raised when an imported row is not valid UTF-8
+    """
+    pass
+
+
+def pause(seconds):
+    if interactive:
+        time.sleep(seconds)
+
+
 def exception_handler(function):
+    @wraps(function)
     def wrapper(*args, **kwargs):
         while True:
             try:
@@ -332,62 +502,91 @@ def exception_handler(function):
 
             except WrongName:
                 lang_obj().return_error('wrong_name', True)
-                time.sleep(1)
+                pause(1)
                 break
             except BirthdayIncorrect:
                 lang_obj().return_error('birthday_incorrect', True)
-                time.sleep(1)
+                pause(1)
                 break
             except NotEnoughArguments:
                 lang_obj().return_error('not_enough_arguments', True)
-                time.sleep(1)
+                pause(1)
                 break
             except NotANumberForCountOFRecords:
                 lang_obj().return_error('not_a_number_for_count_of_records', True)
-                time.sleep(1)
+                pause(1)
                 break
             except WrongPhoneNumberFormat:
                 lang_obj().return_error('wrong_phone_number_format', True)
-                time.sleep(1)
+                pause(1)
                 break
             except NotRightPhoneNumberToUpdate:
-                lang_obj().return_error('not_right_number_to_update', True)
-                time.sleep(1)
+                lang_obj().return_error('not_right_phone_number_to_update', True)
+                pause(1)
                 break
             except WrongEmailFormat:
                 lang_obj().return_error('wrong_email_format', True)
-                time.sleep(1)
+                pause(1)
                 break
             except NameAlreadyExists:
                 lang_obj().return_error('name_already_exists', True)
-                time.sleep(1)
+                pause(1)
                 break
             except PhoneAlreadyExists:
                 lang_obj().return_error('phone_already_exists', True)
-                time.sleep(1)
+                pause(1)
                 break
             except EmailAlreadyExists:
                 lang_obj().return_error('email_already_exists', True)
-                time.sleep(1)
+                pause(1)
                 break
             except NoEmailUpdateTo:
                 lang_obj().return_error('no_email_update_to', True)
-                time.sleep(1)
+                pause(1)
                 break
             except ThisMailDoesNotExist:
                 lang_obj().return_error('this_mail_does_not_exist', True)
-                time.sleep(1)
+                pause(1)
+                break
+            except ContactNotFound as error:
+                lang_obj().return_message('contact_not_found', True, str(error))
+                if error.suggestions:
+                    lang_obj().return_message('did_you_mean', True, ', '.join(error.suggestions))
+                break
+            except EmptyPhonebook:
+                lang_obj().return_message('empty_phonebook', True)
                 break
+            except ImportFileNotFound:
+                lang_obj().return_error('import_file_not_found', True)
+                pause(1)
+                break
+            except UnsupportedImportFormat:
+                lang_obj().return_error('unsupported_import_format', True)
+                pause(1)
+                break
+            except ImportFileUnreadable:
+                lang_obj().return_error('import_file_unreadable', True)
+                pause(1)
+                break
+        return False
 
     return wrapper
 
 
 class Record:
+    """
+    Phones and emails are tuples rebuilt on every change, which saves the spare capacity and the larger header of
+    a list on each of millions of records. Phones keep the display form as entered; phone_keys holds the integer
+    key of each one at the same position, fixed with the country defaults in force when the number was added.
+    The owner indexes share those int objects, so the keys cost one small tuple per record.
+    """
+    __slots__ = ('name', 'phones', 'phone_keys', 'emails', 'birthday')
 
     def __init__(self, name, phone=None, birthday=None, email=None):
         self.name = name
-        self.phones = []
-        self.emails = []
+        self.phones = ()
+        self.phone_keys = ()
+        self.emails = ()
         self.birthday = birthday
 
         if phone:
@@ -397,13 +596,13 @@ class Record:
             self.add_email(email)
 
     def check_phone(self, phone) -> bool:
-        if str(phone) in self.phones:
-            return True
-        return False
+        return phone_key(phone) in self.phone_keys
 
     def add_phone(self, phone) -> bool:
-        if not self.check_phone(phone):
-            self.phones.append(str(phone))
+        key = phone_key(phone)
+        if key not in self.phone_keys:
+            self.phones += (str(phone),)
+            self.phone_keys += (key,)
             return True
         return False
 
@@ -415,8 +614,11 @@ class Record:
         raise NotRightPhoneNumberToUpdate
 
     def delete_phone(self, phone) -> bool:
-        if self.check_phone(phone):
-            self.phones.remove(str(phone))
+        key = phone_key(phone)
+        if key in self.phone_keys:
+            position = self.phone_keys.index(key)
+            self.phones = self.phones[:position] + self.phones[position + 1:]
+            self.phone_keys = self.phone_keys[:position] + self.phone_keys[position + 1:]
             return True
         return False
 
@@ -427,7 +629,7 @@ class Record:
 
     def add_email(self, email) -> bool:
         if not self.check_email(email):
-            self.emails.append(str(email))
+            self.emails += (str(email),)
             return True
         return False
 
@@ -440,13 +642,13 @@ class Record:
 
     def delete_email(self, email) -> bool:
         if self.check_email(email):
-            self.emails.remove(str(email))
+            self.emails = tuple(item for item in self.emails if item != str(email))
             return True
         return False
 
     def append_email(self, email):
         if not self.check_email(email):
-            self.emails.append(str(email))
+            self.emails += (str(email),)
             return True
 
     def check_birthday(self, birthday) -> bool:
@@ -461,41 +663,72 @@ class Record:
             return True
         return False
 
+    def __getstate__(self):
+        return self.name, self.phones, self.emails, self.birthday, self.phone_keys
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # Snapshots pickled before __slots__ store the instance __dict__.
+            state = (state['name'], state['phones'], state['emails'], state['birthday'])
+        if len(state) == 4:
+            # Records saved before phone keys get them from the current country defaults.
+            state = (*state, [phone_key(phone) for phone in state[1]])
+        self.name, phones, emails, self.birthday, phone_keys = state
+        self.phones, self.emails, self.phone_keys = tuple(phones), tuple(emails), tuple(phone_keys)
+
     def __repr__(self):
-        return f'{self.name} -- {self.birthday} -- {self.phones} -- {self.emails}'
+        return f'{self.name} -- {self.birthday} -- {list(self.phones)} -- {list(self.emails)}'
 
 
 class Field:
+    __slots__ = ('_value',)
+
     def __init__(self, value) -> None:
-        self.__value = None
+        self._value = None
         self.value = value
 
+    def __getstate__(self):
+        return (self._value,)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # Snapshots pickled before __slots__ keep the value under a name-mangled key.
+            state = (next((value for key, value in state.items() if key.endswith('__value') and value is not None),
+                          None),)
+        self._value = state[0]
+
 
 class Name(Field):
+    __slots__ = ()
 
     def __repr__(self):
         return self.value
 
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._value = sys.intern(self._value)
+
     @property
     def value(self):
-        return self.__value
+        return self._value
 
     @value.setter
     def value(self, value):
         if re.match(r'^[a-zA-Zа-яА-Я]+$', value):
-            self.__value = value.title()
+            self._value = sys.intern(value.title())
         else:
             raise WrongName
 
 
 class Phone(Field):
+    __slots__ = ()
 
     def __repr__(self):
-        return f'{self.__value}'
+        return f'{self._value}'
 
     @property
     def value(self):
-        return self.__value
+        return self._value
 
     @value.setter
     def value(self, n_value):
@@ -503,399 +736,1443 @@ class Phone(Field):
         for ch in n_value:
             if ch not in "0123456789()-+":
                 raise WrongPhoneNumberFormat
-        self.__value = n_value
+        if not any(ch.isdigit() for ch in n_value):
+            raise WrongPhoneNumberFormat
+        self._value = n_value
+
+    @property
+    def key(self) -> int:
+        return phone_key(self._value)
 
 
 class EMail(Field):
+    __slots__ = ()
+
     def __repr__(self):
         return self.value
 
     @property
     def value(self):
-        return self.__value
+        return self._value
 
     @value.setter
     def value(self, n_value):
         n_value = n_value.strip()
         if not re.match(r'^[a-z\d_\-.]+@[a-z\d_\-.]+\.[a-z]+$', n_value):
             raise WrongEmailFormat
-        self.__value = n_value
+        self._value = n_value
 
 
 class Birthday(Field):
+    """
+    Birthday kept as a date ordinal; value renders it back as "dd.mm.yyyy".
+    """
+    __slots__ = ()
+
     def __repr__(self):
         return self.value
 
     def __str__(self):
         return self.value
 
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if isinstance(self._value, str):
+            self._value = datetime.strptime(self._value, "%d.%m.%Y").toordinal()
+
+    @property
+    def date(self):
+        return date.fromordinal(self._value) if self._value else None
+
     @property
     def value(self):
-        return self.__value
+        return self.date.strftime("%d.%m.%Y") if self._value else None
 
     @value.setter
     def value(self, b_value):
         if b_value:
             try:
-                datetime.strptime(b_value, "%d.%m.%Y")
+                self._value = datetime.strptime(b_value, "%d.%m.%Y").toordinal()
             except ValueError:
                 raise BirthdayIncorrect
         else:
-            self.__value = None
-        self.__value = b_value
+            self._value = None
 
 
-class AddressBook(UserDict):
+class PhoneCountry(NamedTuple):
+    name: str
+    code: str
+    trunk_prefix: str
+    national_digits: int
 
-    def add_record(self, record: Record):
-        self.data[record.name.value] = record
 
-    def __next__(self):
-        return next(self.iterator())
+PHONE_COUNTRIES = {
+    'UA': PhoneCountry('UA', '380', '0', 9),
+    'PL': PhoneCountry('PL', '48', '', 9),
+    'DE': PhoneCountry('DE', '49', '0', 0),
+    'GB': PhoneCountry('GB', '44', '0', 10),
+    'US': PhoneCountry('US', '1', '1', 10),
+}
+phone_country = PHONE_COUNTRIES['UA']
+# bumped whenever stored phone keys have to be recomputed from the display form
+PHONE_KEYS_VERSION = 1
 
-    def iterator(self, n=2):
-        start, page = 0, n
-        while True:
-            yield dict(islice(self.data.items(), start, n))
-            start, n = n, n + page
-            if start >= len(self.data):
-                break
-            gate = input(lang_obj().return_message('enter_to_proceed', False))
 
-address_book = AddressBook()
+def canonical_phone(phone, country=None) -> str:
+    """
+    Digits of the number in international form. A leading + or 00 keeps the number as dialled;
+    a trunk prefix or a bare national number (national_digits long, 0 for any) get the country code.
+    """
+    country = country or phone_country
+    text = str(phone).strip()
+    digits = re.sub(r'\D', '', text)
+    if text.startswith('+'):
+        return digits
+    if digits.startswith('00'):
+        return digits[2:]
+    if country.trunk_prefix and digits.startswith(country.trunk_prefix):
+        return country.code + digits[len(country.trunk_prefix):]
+    if country.national_digits and len(digits) == country.national_digits:
+        return country.code + digits
+    return digits
+
+
+def phone_key(phone) -> int:
+    """
+    Integer key of a phone number: "+38(050)123-45-67", "380501234567" and "0501234567" get the same one.
+    """
+    digits = canonical_phone(phone)
+    return int(digits) if digits else 0
 
-class MainFunctions:
-    @staticmethod
-    @exception_handler
-    def add_contact(*args):
-        try:
-            name = Name(args[0][0])
-            phone = Phone(args[0][1])
-        except IndexError:
-            raise NotEnoughArguments
-        if name.value in address_book:
-            raise NameAlreadyExists
-        elif phone.value in address_book:
-            raise PhoneAlreadyExists
-        record = Record(name, phone)
-        address_book.add_record(record)
-        lang_obj().return_message('contact_added', True, name.value)
 
-    @staticmethod
-    @exception_handler
-    def update_number(*args):
-        if address_book:
-            try:
-                name = Name(args[0][0])
-                if name.value in address_book:
-                    phone = Phone(args[0][1])
-                    if phone.value in address_book:
-                        raise PhoneAlreadyExists
-                    address_book[name.value].update_phone(Phone(args[0][1]), Phone(args[0][2]))
-                    lang_obj().return_message('number_updated', True, name.value)
-                else:
-                    lang_obj().return_message('contact_not_found', True, name.value)
-            except IndexError:
-                raise NotEnoughArguments
-        else:
-            lang_obj().return_message('empty_phonebook', True)
+def normalize_email(email) -> str:
+    return str(email).lower()
 
-    @staticmethod
-    @exception_handler
-    def append_number(*args):
-        if address_book:
-            try:
-                name = Name(args[0][0])
-                if name.value in address_book:
-                    phone = Phone(args[0][1])
-                    if phone.value in address_book:
-                        raise PhoneAlreadyExists
-                    address_book[name.value].add_phone(Phone(args[0][1]))
-                    lang_obj().return_message('number_appended', True, args[0][1], name.value)
-                else:
-                    lang_obj().return_message('contact_not_found', True, name.value)
-            except IndexError:
-                raise NotEnoughArguments
-        else:
-            lang_obj().return_message('empty_phonebook', True)
 
-    @staticmethod
-    @exception_handler
-    def delete_phone_number(*args):
-        if address_book:
-            try:
-                name = Name(args[0][0])
-                if name.value in address_book:
-                    address_book[name.value].delete_phone(Phone(args[0][1]))
-                    lang_obj().return_message('number_deleted', True, args[0][1], name.value)
-                else:
-                    lang_obj().return_message('contact_not_found', True, name.value)
-            except IndexError:
-                raise NotEnoughArguments
-        else:
-            lang_obj().return_message('empty_phonebook', True)
+class UniqueIndex:
+    """
+    Reverse index from a normalized phone or email to the name of the record that owns it.
+    """
 
-    @staticmethod
-    @exception_handler
-    def delete_contact(*args):
-        if address_book:
-            try:
-                name = Name(args[0][0])
-                if name.value in address_book:
-                    del address_book[name.value]
-                    lang_obj().return_message('contact_deleted', True, name.value)
-                else:
-                    lang_obj().return_message('contact_not_found', True, name.value)
-            except IndexError:
-                raise NotEnoughArguments
-        else:
-            lang_obj().return_message('empty_phonebook', True)
+    def __init__(self, keys):
+        self.keys = keys
+        self.owners = {}
+        self.by_name = {}
 
-    @staticmethod
-    @exception_handler
-    def show_all(*args):
-        SubFunctions.clear_screen()
-        lang_obj().return_message('phonebook', True)
-        if address_book:
-            how_much_recs = input(lang_obj().return_message('how_much_recs', False))
-            if how_much_recs == '':
-                how_much_recs = len(address_book)
-            elif how_much_recs.isalpha():
-                raise NotANumberForCountOFRecords
-            elif int(how_much_recs) <= 0:
-                lang_obj().return_message('wrong_recs_count', True)
-                how_much_recs = 1
-            for rec in address_book.iterator(int(how_much_recs)):
-                while True:
-                    for name, value in rec.items():
-                        lang_obj().return_message('show_all_contact', True, name)
-                        lang_obj().return_message('show_all_numbers', True)
-                        for phone in value.phones:
-                            print(f'{phone};')
-                        print(f'----------------\n{lang_obj().return_message("show_all_bd", False)}'
-                              f'{value.birthday if value.birthday else lang_obj().return_message("not_specified", False)}')
-                        print(f'----------------\nEmail: ')
-                        if value.emails:
-                            for email in value.emails:
-                                print(f'{email};\n')
-                        else:
-                            lang_obj().return_message('not_specified', True)
-                    break
-            lang_obj().return_message('end_of_phonebook', True)
-        else:
-            lang_obj().return_message('empty_phonebook', True)
+    def add(self, name, record):
+        keys = tuple(self.keys(record))
+        self.by_name[name] = keys
+        for key in keys:
+            self.owners[key] = name
 
-    @staticmethod
-    @exception_handler
-    def search_command(*args) -> None:
-        SubFunctions.clear_screen()
-        if address_book:
-            lang_obj().return_message('contact_search', True)
-            search = input(lang_obj().return_message('search_input', False))
-            found = False
-            for name, value in address_book.items():
-                if re.search(search, name, re.IGNORECASE):
-                    lang_obj().return_message('found_in_record', True, name)
-                    lang_obj().return_message('show_all_numbers', True)
-                    for phone in value.phones:
-                        print(f'{phone};')
-                    print(f'Email: ')
-                    if value.emails:
-                        for email in value.emails:
-                            print(f'{email};')
-                    found = True
-
-                if not found:
-                    for phone in value.phones:
-                        if re.search(search, phone, re.IGNORECASE):
-                            lang_obj().return_message('found_in_record', True, name)
-                            lang_obj().return_message('show_all_numbers', True)
-                            for phone in value.phones:
-                                print(f'{phone};')
-                            print(f'Email: ')
-                            if value.emails:
-                                for email in value.emails:
-                                    print(f'{email};')
-                            found = True
-                        if not found:
-                            for email in value.emails:
-                                if re.search(search, email, re.IGNORECASE):
-                                    lang_obj().return_message('found_in_record', True, name)
-                                    lang_obj().return_message('show_all_numbers', True)
-                                    for phone in value.phones:
-                                        print(f'{phone};')
-                                    print(f'Email: ')
-                                    if value.emails:
-                                        for email in value.emails:
-                                            print(f'{email};')
-                                    found = True
-                                if not found:
-                                    lang_obj().return_message('not_found', True, search)
+    def discard(self, name):
+        for key in self.by_name.pop(name, ()):
+            if self.owners.get(key) == name:
+                del self.owners[key]
 
-    @staticmethod
-    @exception_handler
-    def add_email(*args):
-        if address_book:
-            try:
-                name = Name(args[0][0])
-                if name.value in address_book:
-                    email = EMail(args[0][1])
-                    if email.value in address_book[name.value].emails:
-                        raise EmailAlreadyExists
-                    address_book[name.value].add_email(EMail(args[0][1]))
-                    lang_obj().return_message('email_added', True, args[0][1], name.value)
-                else:
-                    lang_obj().return_message('contact_not_found', True, name.value)
-            except IndexError:
-                raise NotEnoughArguments
-        else:
-            lang_obj().return_message('empty_phonebook', True)
+    def clear(self):
+        self.owners.clear()
+        self.by_name.clear()
 
-    @staticmethod
-    @exception_handler
-    def update_email(*args):
-        if address_book:
-            try:
-                name = Name(args[0][0])
-                if name.value in address_book:
-                    address_book[name.value].update_email(EMail(args[0][1]), EMail(args[0][2]))
-                    lang_obj().return_message('email_updated', True, args[0][1], name.value)
-                else:
-                    lang_obj().return_message('contact_not_found', True, name.value)
-            except IndexError:
-                raise NotEnoughArguments
-            except TypeError:
-                raise NoEmailUpdateTo
-        else:
-            lang_obj().return_message('empty_phonebook', True)
+    def get(self, key):
+        return self.owners.get(key)
 
-    @staticmethod
-    @exception_handler
-    def append_email(*args):
-        if address_book:
-            try:
-                name = Name(args[0][0])
-                if name.value in address_book:
-                    address_book[name.value].append_email(EMail(args[0][1]))
-                    lang_obj().return_message('email_appended', True, args[0][1], name.value)
-                else:
-                    lang_obj().return_message('contact_not_found', True, name.value)
-            except IndexError:
-                raise NotEnoughArguments
-        else:
-            lang_obj().return_message('empty_phonebook', True)
 
-    @staticmethod
-    @exception_handler
-    def delete_email(*args):
-        if address_book:
-            try:
-                name = Name(args[0][0])
-                if name.value in address_book:
-                    address_book[name.value].delete_email(EMail(args[0][1]))
-                    lang_obj().return_message('email_deleted', True, args[0][1], name.value)
-                else:
-                    lang_obj().return_message('contact_not_found', True, name.value)
-            except IndexError:
-                raise NotEnoughArguments
-        else:
-            lang_obj().return_message('empty_phonebook', True)
+def search_terms(record):
+    yield record.name.value.lower()
+    yield from record.phones
+    for email in record.emails:
+        yield email.lower()
 
-    @staticmethod
-    @exception_handler
-    def add_birthday(*args):
-        if address_book:
-            try:
-                name = Name(args[0][0])
-                if name.value in address_book:
-                    address_book[name.value].add_birthday(Birthday(args[0][1]))
-                    lang_obj().return_message('bd_added', True, args[0][1], name.value)
-                else:
-                    lang_obj().return_message('contact_not_found', True, name.value)
-            except IndexError:
-                raise NotEnoughArguments
-        else:
-            lang_obj().return_message('empty_phonebook', True)
 
-    @staticmethod
-    @exception_handler
-    def near_bd(*args):
-        try:
-            days = int(args[0][0])
-        except NotEnoughArguments:
-            lang_obj().return_message('no_number_of_days_to_search', True)
-            return False
-        if address_book:
-            lang_obj().return_message('search_for_bd', True)
-            today = datetime.now().date()
-            for name, data in address_book.items():
-                if data.birthday:
-                    get_dude_date = data.birthday.value.split('.')
-
-                    dude_date = datetime(year=today.year, month=int(get_dude_date[1]), day=int(get_dude_date[0])).date()
-                    date_plus = today + timedelta(days=days)
-                    days_to_bd = (dude_date - today).days
-                    if today <= dude_date <= date_plus:
-                        lang_obj().return_message('bd_search_result', True, name, data.birthday, days_to_bd)
-            lang_obj().return_message('search_result', True)
-        else:
-            lang_obj().return_message('empty_phonebook', True)
+SEARCH_METACHARACTERS = re.compile(r'[\\|?*{}()\[\]]')
 
-    @staticmethod
-    def clear_phonebook(*args):
-        ask = input(lang_obj().return_message('clear_phonebook', False))
-        if ask == 'y':
-            address_book.clear()
-            lang_obj().return_message('phonebook_cleared', True)
-        else:
-            lang_obj().return_message('phonebook_not_cleared', True)
+
+@lru_cache(maxsize=256)
+def compile_search(query):
+    try:
+        return re.compile(query, re.IGNORECASE)
+    except re.error:
+        return re.compile(re.escape(query), re.IGNORECASE)
 
 
+def literal_fragments(query) -> list:
+    """
+    Substrings every match of the query must contain, or an empty list for real regular expressions.
+    """
+    if SEARCH_METACHARACTERS.search(query):
+        return []
+    return [fragment.lower() for fragment in re.split(r'[.^$+]', query)]
 
 
-...
+class TrigramIndex:
+    """
+    Inverted index from lowercase trigrams of names, phones and emails to record names.
+    """
 
+    def __init__(self, terms):
+        self.terms = terms
+        self.postings = defaultdict(set)
+        self.by_name = {}
 
-class SubFunctions:
     @staticmethod
-    def top_secret(*args):
-        SubFunctions.clear_screen()
-        print('Ok, you asked for it.')
-        time.sleep(2)
-        print('Folder System32 deleting is initiated.')
-        time.sleep(1)
-        print('Say goodbye to your computer.')
-        time.sleep(1)
-        print('Starting deletion...')
-        time.sleep(3)
-        print('10...')
-        time.sleep(1)
-        print('9...')
-        time.sleep(1)
-        print('8...')
-        time.sleep(1)
-        print('7...')
-        time.sleep(1)
-        print('6...')
-        time.sleep(1)
-        print('5...')
-        time.sleep(1)
-        print('You still think this is a joke?')
-        time.sleep(1)
-        print('3...')
-        time.sleep(1)
-        print('2...')
-        time.sleep(1)
-        print('1...')
-        time.sleep(3)
-        print('0...')
-        time.sleep(3)
-        print('Folder System32 deleted.')
-        time.sleep(1)
+    def trigrams(term) -> set:
+        return {term[i:i + 3] for i in range(len(term) - 2)}
+
+    def add(self, name, record):
+        grams = set()
+        for term in self.terms(record):
+            grams |= self.trigrams(term)
+        self.by_name[name] = grams
+        for gram in grams:
+            self.postings[gram].add(name)
+
+    def discard(self, name):
+        for gram in self.by_name.pop(name, ()):
+            names = self.postings[gram]
+            names.discard(name)
+            if not names:
+                del self.postings[gram]
+
+    def clear(self):
+        self.postings.clear()
+        self.by_name.clear()
+
+    def candidates(self, fragments):
+        grams = set()
+        for fragment in fragments:
+            grams |= self.trigrams(fragment)
+        if not grams:
+            return None
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        names = set(postings[0])
+        for posting in postings[1:]:
+            if not names:
+                break
+            names &= posting
+        return names
+
+
+PARALLEL_SEARCH_MIN = 200000
+search_workers = 0
+_scan_names = _scan_data = None
+_scan_pool = _scan_source = None
+
+
+def scan_terms(pattern, rows) -> list:
+    return sorted(name for name, terms in rows if any(pattern.search(term) for term in terms))
+
+
+def scan_shard(pattern, start, stop) -> list:
+    return scan_terms(pattern, ((name, search_terms(_scan_data[name])) for name in _scan_names[start:stop]))
+
+
+def scan_pool(data, generation, workers):
+    """
+    Process pool for parallel_search, kept across queries. Forked workers read the book from the memory they
+    were forked with, so a pool is only reused for the same data at the same generation. Forking while another
+    thread runs (BackgroundSaver, the journal compactor, the server's pool) could copy a lock that thread holds,
+    so then no pool is made and None is returned. Without fork one spawned pool serves every book.
+    """
+    global _scan_pool, _scan_source, _scan_names, _scan_data
+    fork = 'fork' in multiprocessing.get_all_start_methods()
+    source = (generation, workers) if fork else workers
+    if _scan_pool is not None and _scan_source == source and (not fork or _scan_data is data):
+        return _scan_pool
+    close_scan_pool()
+    if fork:
+        if threading.active_count() > 1:
+            return None
+        _scan_names, _scan_data = list(data), data
+    _scan_pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork') if fork else None)
+    _scan_source = source
+    return _scan_pool
+
+
+def close_scan_pool():
+    global _scan_pool, _scan_source, _scan_names, _scan_data
+    if _scan_pool is not None:
+        _scan_pool.shutdown()
+    _scan_pool = _scan_source = _scan_names = _scan_data = None
+
+
+def parallel_search(pattern, data, workers, generation=0):
+    """
+    Full scan of data with one shard per worker process; yields the matching names in order.
+    Forked workers read their shard straight from the parent's memory, otherwise shards are pickled over.
+    When no pool can be forked safely the scan runs in this process.
+    """
+    pool = scan_pool(data, generation, workers)
+    if pool is None:
+        yield from scan_terms(pattern, ((name, search_terms(data[name])) for name in data))
+        return
+    forked = _scan_data is data
+    names = _scan_names if forked else list(data)
+    size = -(-len(names) // workers)
+    bounds = [(start, min(start + size, len(names))) for start in range(0, len(names), size)]
+    if forked:
+        shards = [pool.submit(scan_shard, pattern, start, stop) for start, stop in bounds]
+    else:
+        shards = [pool.submit(scan_terms, pattern,
+                              [(name, list(search_terms(data[name]))) for name in names[start:stop]])
+                  for start, stop in bounds]
+    yield from heapq.merge(*(shard.result() for shard in shards))
+
+
+def birthday_window(today, days):
+    """
+    Yields (days until, (month, day)) for the next days, wrapping over the year end.
+    Feb 29 birthdays are celebrated on Feb 28 in common years.
+    """
+    visited = set()
+    for offset in range(min(days, 366) + 1):
+        current = today + timedelta(days=offset)
+        if (current.month, current.day) in visited:
+            break
+        keys = [(current.month, current.day)]
+        if current.month == 2 and current.day == 28 and not isleap(current.year):
+            keys.append((2, 29))
+        for key in keys:
+            if key not in visited:
+                visited.add(key)
+                yield offset, key
+
+
+class BirthdayIndex:
+    """
+    Calendar of record names bucketed by birthday month and day.
+    """
+
+    def __init__(self):
+        self.buckets = defaultdict(set)
+        self.by_name = {}
+
+    def add(self, name, record):
+        if record.birthday and record.birthday.date:
+            key = (record.birthday.date.month, record.birthday.date.day)
+            self.by_name[name] = key
+            self.buckets[key].add(name)
+
+    def discard(self, name):
+        key = self.by_name.pop(name, None)
+        if key:
+            names = self.buckets[key]
+            names.discard(name)
+            if not names:
+                del self.buckets[key]
+
+    def clear(self):
+        self.buckets.clear()
+        self.by_name.clear()
+
+    def upcoming(self, today, days) -> list:
+        result = []
+        for offset, key in birthday_window(today, days):
+            result.extend((name, offset) for name in sorted(self.buckets.get(key, ())))
+        return result
+
+
+class BirthdayColumns:
+    """
+    Columnar birthday store for NumPy: one month * 32 + day key per slot, answered for the whole
+    book at once by looking every key up in a table of days until that date.
+    """
+    NO_BIRTHDAY = 0
+
+    def __init__(self, capacity=1024):
+        self.keys = np.zeros(capacity, dtype=np.int16)
+        self.names = [None] * capacity
+        self.slots = {}
+        self.free = []
+        self.used = 0
+
+    def add(self, name, record):
+        if not (record.birthday and record.birthday.date):
+            return
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.used == len(self.keys):
+                self.keys = np.concatenate([self.keys, np.zeros(len(self.keys), dtype=np.int16)])
+                self.names.extend([None] * len(self.names))
+            slot, self.used = self.used, self.used + 1
+        self.keys[slot] = record.birthday.date.month * 32 + record.birthday.date.day
+        self.names[slot] = name
+        self.slots[name] = slot
+
+    def discard(self, name):
+        slot = self.slots.pop(name, None)
+        if slot is not None:
+            self.keys[slot] = self.NO_BIRTHDAY
+            self.names[slot] = None
+            self.free.append(slot)
+
+    def clear(self):
+        self.keys[:] = self.NO_BIRTHDAY
+        self.names = [None] * len(self.names)
+        self.slots.clear()
+        self.free.clear()
+        self.used = 0
+
+    def upcoming(self, today, days) -> list:
+        table = np.full(13 * 32, 32767, dtype=np.int16)
+        for offset, (month, day) in birthday_window(today, days):
+            table[month * 32 + day] = offset
+        keys = self.keys[:self.used]
+        offsets = table[keys]
+        slots = np.flatnonzero((keys != self.NO_BIRTHDAY) & (offsets <= min(days, 366)))
+        matches = sorted(zip(offsets[slots].tolist(), self.keys[slots].tolist(), [self.names[slot] for slot in slots]))
+        return [(name, offset) for offset, _, name in matches]
+
+
+def edit_distance(first, second) -> int:
+    if len(first) < len(second):
+        first, second = second, first
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (first_char != second_char)))
+        previous = current
+    return previous[-1]
+
+
+FUZZY_MAX_DISTANCE = 2
+FUZZY_LIMIT = 5
+
+
+class FuzzyNameIndex:
+    """
+    BK-tree over lowercased names for "did you mean" lookups. Names that are removed stay in
+    the tree as dead nodes until those outnumber the live ones and the tree is rebuilt.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.words = set()
+        self.names = defaultdict(set)
+
+    def insert(self, word):
+        if word in self.words:
+            return
+        self.words.add(word)
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            distance = edit_distance(word, node[0])
+            if distance not in node[1]:
+                node[1][distance] = (word, {})
+                return
+            node = node[1][distance]
+
+    def add(self, name, record):
+        word = name.lower()
+        self.insert(word)
+        self.names[word].add(name)
+
+    def discard(self, name):
+        word = name.lower()
+        names = self.names.get(word)
+        if names:
+            names.discard(name)
+            if not names:
+                del self.names[word]
+        if len(self.words) > 2 * len(self.names) + 64:
+            self.root, self.words = None, set()
+            for word in self.names:
+                self.insert(word)
+
+    def clear(self):
+        self.root = None
+        self.words.clear()
+        self.names.clear()
+
+    def closest(self, query, max_distance=FUZZY_MAX_DISTANCE, limit=FUZZY_LIMIT) -> list:
+        query, found = query.lower(), []
+        nodes = [self.root] if self.root else []
+        while nodes:
+            word, children = nodes.pop()
+            distance = edit_distance(query, word)
+            if distance <= max_distance and word in self.names:
+                found.extend((distance, name) for name in self.names[word])
+            nodes.extend(child for edge, child in children.items() if abs(edge - distance) <= max_distance)
+        return [name for _, name in sorted(found)[:limit]]
+
+
+class SortedNameIndex:
+    """
+    Names in order kept as a list of sorted blocks, so an insert or delete shifts one block only
+    and a range starts with two bisects. Name values are title-cased, which makes plain string
+    order alphabetical for both Latin and Cyrillic names (Latin ones come first).
+    """
+    BLOCK_SIZE = 512
+
+    def __init__(self):
+        self.blocks = []
+        self.maxes = []
+        self.names = set()
+
+    def add(self, name, record):
+        if name in self.names:
+            return
+        self.names.add(name)
+        if not self.blocks:
+            self.blocks.append([name])
+            self.maxes.append(name)
+            return
+        index = min(bisect_left(self.maxes, name), len(self.blocks) - 1)
+        block = self.blocks[index]
+        insort(block, name)
+        self.maxes[index] = block[-1]
+        if len(block) > 2 * self.BLOCK_SIZE:
+            self.blocks.insert(index + 1, block[self.BLOCK_SIZE:])
+            del block[self.BLOCK_SIZE:]
+            self.maxes.insert(index, block[-1])
+
+    def discard(self, name):
+        if name not in self.names:
+            return
+        self.names.discard(name)
+        index = bisect_left(self.maxes, name)
+        block = self.blocks[index]
+        del block[bisect_left(block, name)]
+        if block:
+            self.maxes[index] = block[-1]
+        else:
+            del self.blocks[index]
+            del self.maxes[index]
+
+    def clear(self):
+        self.blocks.clear()
+        self.maxes.clear()
+        self.names.clear()
+
+    def locate(self, name, right=False) -> tuple:
+        find = bisect_right if right else bisect_left
+        index = find(self.maxes, name)
+        if index == len(self.blocks):
+            return index, 0
+        return index, find(self.blocks[index], name)
+
+    def between(self, first=None, last=None, after=None):
+        """
+        Names from first up to the ones starting with last, both optional, resuming after a name.
+        """
+        position = (0, 0)
+        if first is not None:
+            position = max(position, self.locate(first))
+        if after is not None:
+            position = max(position, self.locate(after, right=True))
+        stop = None if last is None else last + '\U0010ffff'
+        index, offset = position
+        for block in self.blocks[index:]:
+            for name in islice(block, offset, None):
+                if stop is not None and name >= stop:
+                    return
+                yield name
+            offset = 0
+
+
+class PageCursor:
+    """
+    Streams pages of (name, record) items, each one picking up where the previous page ended.
+    Pass after=<name> to resume from the record following that name.
+    """
+
+    def __init__(self, items, size, after=None):
+        self.size = size
+        self.items = iter(items)
+        self.last_key = None
+        if after is not None:
+            for key, _ in self.items:
+                if key == after:
+                    break
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> dict:
+        page = dict(islice(self.items, self.size))
+        if not page:
+            raise StopIteration
+        self.last_key = next(reversed(page))
+        return page
+
+
+class BloomFilter:
+    """
+    Bloom filter over strings sized for capacity keys at the given false positive rate.
+    The bit positions come from one blake2b digest by double hashing. Keys are never removed,
+    stale bits only raise the false positive rate until the filter is rebuilt.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1024)
+        self.error_rate = error_rate
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.checks = self.saved = self.false_positives = 0
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self.positions(key)
+        if not all(self.bits[position >> 3] & (1 << (position & 7)) for position in positions):
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def check(self, key) -> bool:
+        self.checks += 1
+        if all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key)):
+            return True
+        self.saved += 1
+        return False
+
+
+bloom_error_rate = None
+
+
+def bloom_checked(prefix, normalize):
+    """
+    Lets the book's Bloom filter answer for values it has never seen before the real owner lookup runs.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, value):
+            if self.bloom is None:
+                return method(self, value)
+            if not self.bloom.check(f'{prefix}{normalize(value)}'):
+                return None
+            owner = method(self, value)
+            if owner is None:
+                self.bloom.false_positives += 1
+            return owner
+        return wrapper
+    return decorator
+
+
+class AddressBook(UserDict):
+    journal = None
+    saver = None
+    bloom = None
+    undo = None
+    # bumped on every change, so that parallel_search knows when its forked workers hold an old copy
+    generation = 0
+    # whether lookups leave the book untouched, so that several threads may read at once
+    concurrent_reads = True
+
+    def __init__(self, *args, **kwargs):
+        self.phone_index = UniqueIndex(lambda record: record.phone_keys)
+        self.email_index = UniqueIndex(lambda record: (normalize_email(email) for email in record.emails))
+        self.trigram_index = TrigramIndex(search_terms)
+        self.birthday_index = BirthdayIndex() if np is None else BirthdayColumns()
+        self.name_index = SortedNameIndex()
+        self.indexes = [self.phone_index, self.email_index, self.trigram_index, self.birthday_index,
+                        self.name_index]
+        self.fuzzy_index = None
+        super().__init__(*args, **kwargs)
+
+    def open(self, journaled=True, write_behind=None):
+        data = {}
+        try:
+            with open(PHONEBOOK_FILE, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            pass
+        except ModuleNotFoundError:
+            print("Preparing some stuff for you...")
+            pass
+        journal = Journal(JOURNAL_FILE, PHONEBOOK_FILE)
+        replayed = journal.replay(data)
+        self.load(data)
+        if replayed or not os.path.exists(PHONEBOOK_FILE):
+            journal.checkpoint(data)
+        if journaled and write_behind is None:
+            if not journal.file:
+                journal.open()
+            self.journal = journal
+        else:
+            journal.close()
+        if write_behind is not None:
+            self.saver = BackgroundSaver(self, PHONEBOOK_FILE, write_behind)
+            self.saver.start()
+
+    def commit(self):
+        if self.journal:
+            self.journal.flush()
+
+    def save(self):
+        if self.journal:
+            self.journal.checkpoint(self.data)
+        else:
+            write_snapshot(PHONEBOOK_FILE, self.data)
+
+    def close(self):
+        if self.journal:
+            self.journal.close()
+        if self.saver:
+            self.saver.stop()
+        close_scan_pool()
+
+    def locked(self):
+        return self.saver.lock if self.saver else nullcontext()
+
+    def begin(self):
+        """
+        Starts keeping a copy of every record as it was before its first change, for rollback().
+        """
+        self.undo = {}
+
+    def remember(self, name):
+        if self.undo is not None and name not in self.undo:
+            self.undo[name] = copy.deepcopy(self[name]) if name in self else None
+
+    def rollback(self):
+        undo, self.undo = self.undo or {}, None
+        for name, record in reversed(list(undo.items())):
+            if record is not None:
+                self[name] = record
+            elif name in self:
+                del self[name]
+
+    def end(self):
+        self.undo = None
+
+    def load(self, data):
+        self.data = data
+        self.generation += 1
+        self.fuzzy_index = None
+        for index in self.indexes:
+            index.clear()
+            for name, record in data.items():
+                index.add(name, record)
+
+    def add_record(self, record: Record):
+        self[record.name.value] = record
+
+    def build_bloom(self, error_rate, capacity=None):
+        """
+        (Re)builds the Bloom filter over every phone and email, keeping the lookup stats.
+        """
+        old, self.bloom = self.bloom, BloomFilter(capacity or 2 * len(self), error_rate)
+        if old is not None:
+            self.bloom.checks, self.bloom.saved, self.bloom.false_positives = \
+                old.checks, old.saved, old.false_positives
+        for record in self.data.values():
+            self.bloom_add(record)
+
+    def bloom_add(self, record):
+        if self.bloom is None:
+            return
+        phones, emails, _ = record_keys(record)
+        for key in phones:
+            self.bloom.add(f'tel:{key}')
+        for key in emails:
+            self.bloom.add(f'mail:{key}')
+        if self.bloom.count > self.bloom.capacity:
+            self.build_bloom(self.bloom.error_rate, 2 * self.bloom.capacity)
+
+    @bloom_checked('tel:', phone_key)
+    def phone_owner(self, phone):
+        return self.phone_index.get(phone_key(phone))
+
+    @bloom_checked('mail:', normalize_email)
+    def email_owner(self, email):
+        return self.email_index.get(normalize_email(email))
+
+    def search(self, query) -> list:
+        pattern = compile_search(query)
+        candidates = self.trigram_index.candidates(literal_fragments(query))
+        if candidates is None and search_workers > 1 and len(self.data) >= PARALLEL_SEARCH_MIN:
+            return list(parallel_search(pattern, self.data, search_workers, self.generation))
+        names = self.data if candidates is None else candidates
+        return sorted(name for name in names
+                      if any(pattern.search(term) for term in search_terms(self.data[name])))
+
+    def upcoming_birthdays(self, days, today=None) -> list:
+        return self.birthday_index.upcoming(today or datetime.now().date(), days)
+
+    def similar_names(self, name, max_distance=FUZZY_MAX_DISTANCE, limit=FUZZY_LIMIT) -> list:
+        """
+        Closest names by edit distance; the BK-tree is built on first use and kept in sync afterwards.
+        """
+        if self.fuzzy_index is None:
+            fuzzy_index = FuzzyNameIndex()
+            for known in self.data:
+                fuzzy_index.add(known, None)
+            self.fuzzy_index = fuzzy_index
+        return self.fuzzy_index.closest(name, max_distance, limit)
+
+    def birthday_report(self, windows, today=None) -> dict:
+        """
+        Upcoming birthdays for several windows from a single query over the widest one.
+        """
+        matches = self.upcoming_birthdays(max(windows), today)
+        offsets = [offset for _, offset in matches]
+        return {days: matches[:bisect_right(offsets, days)] for days in windows}
+
+    def record_changed(self, name):
+        record = self.data.get(name)
+        self.generation += 1
+        for index in self.indexes:
+            index.discard(name)
+            if record is not None:
+                index.add(name, record)
+        if record is not None:
+            self.bloom_add(record)
+        if self.fuzzy_index is not None:
+            if record is not None:
+                self.fuzzy_index.add(name, record)
+            else:
+                self.fuzzy_index.discard(name)
+        if self.journal:
+            if record is not None:
+                self.journal.append('put', name, record)
+            else:
+                self.journal.append('del', name)
+        if self.saver:
+            self.saver.mark_dirty()
+
+    def __setitem__(self, key, item):
+        self.data[key] = item
+        self.record_changed(key)
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.record_changed(key)
+
+    def clear(self):
+        self.data.clear()
+        self.generation += 1
+        self.fuzzy_index = None
+        if self.bloom is not None:
+            self.build_bloom(self.bloom.error_rate)
+        for index in self.indexes:
+            index.clear()
+        if self.journal:
+            self.journal.append('clear')
+        if self.saver:
+            self.saver.mark_dirty()
+
+    def iterator(self, n=2, after=None):
+        return PageCursor(self.data.items(), n, after)
+
+    def names_between(self, first=None, last=None, after=None):
+        return self.name_index.between(first, last, after)
+
+    def sorted_iterator(self, n=2, after=None, first=None, last=None):
+        """
+        Pages of records in name order, optionally limited to names from first to last.
+        """
+        return PageCursor(((name, self.data[name]) for name in self.names_between(first, last, after)), n)
+
+
+address_book = AddressBook()
+
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_ERRORS = {
+    WrongName: 'wrong_name',
+    BirthdayIncorrect: 'birthday_incorrect',
+    NotEnoughArguments: 'not_enough_arguments',
+    WrongPhoneNumberFormat: 'wrong_phone_number_format',
+    WrongEmailFormat: 'wrong_email_format',
+    NameAlreadyExists: 'name_already_exists',
+    PhoneAlreadyExists: 'phone_already_exists',
+    EmailAlreadyExists: 'email_already_exists',
+    UndecodableRow: 'undecodable_row',
+}
+# bytes that are not UTF-8 are read as lone surrogates so that only their rows get rejected
+UNDECODABLE = re.compile('[\udc80-\udcff]')
+
+
+def split_values(value) -> list:
+    return [part.strip() for part in (value or '').split(';') if part.strip()]
+
+
+def read_csv_contacts(path):
+    """
+    Yields (line number, fields) from a CSV file with name, phone(s), email(s) and birthday columns.
+    Several phones or emails in one cell are separated by ';'.
+    """
+    try:
+        with open(path, newline='', encoding='utf-8-sig', errors='surrogateescape') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                row = {(key or '').strip().lower(): value for key, value in row.items()}
+                yield reader.line_num, {
+                    'name': (row.get('name') or '').strip(),
+                    'phones': split_values(row.get('phones') or row.get('phone')),
+                    'emails': split_values(row.get('emails') or row.get('email')),
+                    'birthday': (row.get('birthday') or '').strip(),
+                }
+    except (OSError, csv.Error):
+        raise ImportFileUnreadable
+
+
+def vcard_birthday(value) -> str:
+    match = re.match(r'^(\d{4})-?(\d{2})-?(\d{2})', value)
+    if match:
+        return f'{match[3]}.{match[2]}.{match[1]}'
+    return value
+
+
+def vcard_name(value) -> str:
+    """
+    Names may only hold letters, so "John Smith" or "Smith;John" become "JohnSmith" (stored as "Johnsmith").
+    """
+    return ''.join(re.findall(r'[a-zA-Zа-яА-Я]+', value))
+
+
+def unfold_vcard_lines(f):
+    number, current = 0, None
+    for line_number, line in enumerate(f, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield number, current
+        number, current = line_number, line
+    if current is not None:
+        yield number, current
+
+
+def read_vcard_contacts(path):
+    """
+    Yields (line number of BEGIN:VCARD, fields) for every card in a vCard file, one card at a time.
+    """
+    fields, position, family_name = None, 0, ''
+    try:
+        with open(path, encoding='utf-8-sig', errors='surrogateescape') as f:
+            for number, line in unfold_vcard_lines(f):
+                prop, _, value = line.partition(':')
+                prop = prop.split(';')[0].split('.')[-1].upper()
+                if prop == 'BEGIN' and value.strip().upper() == 'VCARD':
+                    fields, position = {'name': '', 'phones': [], 'emails': [], 'birthday': ''}, number
+                    family_name = ''
+                elif fields is None:
+                    continue
+                elif prop == 'FN':
+                    fields['name'] = vcard_name(value)
+                elif prop == 'N':
+                    family, _, given = value.partition(';')
+                    family_name = vcard_name(given.split(';')[0] + family)
+                elif prop == 'TEL':
+                    fields['phones'].append(value.strip())
+                elif prop == 'EMAIL':
+                    fields['emails'].append(value.strip())
+                elif prop == 'BDAY':
+                    fields['birthday'] = vcard_birthday(value.strip())
+                elif prop == 'END':
+                    fields['name'] = fields['name'] or family_name
+                    yield position, fields
+                    fields = None
+    except OSError:
+        raise ImportFileUnreadable
+
+
+def read_contacts(path):
+    if not os.path.exists(path):
+        raise ImportFileNotFound
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        return read_csv_contacts(path)
+    elif suffix in ('.vcf', '.vcard'):
+        return read_vcard_contacts(path)
+    raise UnsupportedImportFormat
+
+
+def validate_contacts(contacts):
+    for position, fields in contacts:
+        try:
+            if any(UNDECODABLE.search(value) for value in (fields['name'], fields['birthday'],
+                                                           *fields['phones'], *fields['emails'])):
+                raise UndecodableRow
+            record = Record(Name(fields['name']),
+                            birthday=Birthday(fields['birthday']) if fields['birthday'] else None)
+            if not fields['phones']:
+                raise NotEnoughArguments
+            for phone in fields['phones']:
+                record.add_phone(Phone(''.join(phone.split())).value)
+            for email in fields['emails']:
+                record.add_email(EMail(email).value)
+        except tuple(IMPORT_ERRORS) as error:
+            yield position, None, IMPORT_ERRORS[type(error)]
+        else:
+            yield position, record, None
+
+
+def dedupe_contacts(validated, book):
+    for position, record, error in validated:
+        if record is not None:
+            if record.name.value in book:
+                record, error = None, IMPORT_ERRORS[NameAlreadyExists]
+            elif any(book.phone_owner(phone) for phone in record.phones):
+                record, error = None, IMPORT_ERRORS[PhoneAlreadyExists]
+            elif any(book.email_owner(email) for email in record.emails):
+                record, error = None, IMPORT_ERRORS[EmailAlreadyExists]
+        yield position, record, error
+
+
+def import_contacts(path, book, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Streams contacts from a CSV or vCard file into the book, committing every chunk_size inserts.
+    Yields (position, error key or None) for every row read.
+    """
+    pending = 0
+    for position, record, error in dedupe_contacts(validate_contacts(read_contacts(path)), book):
+        if record is not None:
+            book.add_record(record)
+            pending += 1
+            if pending >= chunk_size:
+                book.commit()
+                pending = 0
+        yield position, error
+    book.commit()
+
+
+class BirthdayMatch(NamedTuple):
+    record: Record
+    days: int
+
+
+class PhonebookEngine:
+    """
+    Phonebook operations without console I/O: methods take plain values, return records
+    and raise the phonebook exceptions. MainFunctions render the results for the CLI.
+    """
+
+    def __init__(self, book=None):
+        self._book = book
+
+    @property
+    def book(self) -> AddressBook:
+        return address_book if self._book is None else self._book
+
+    def count(self) -> int:
+        return len(self.book)
+
+    def contact(self, name) -> Record:
+        name = Name(name).value
+        if name not in self.book:
+            raise ContactNotFound(name, self.book.similar_names(name))
+        return self.book[name]
+
+    def existing(self, name) -> Record:
+        if not self.book:
+            raise EmptyPhonebook
+        return self.contact(name)
+
+    def phone_owner(self, phone):
+        return self.book.phone_owner(phone)
+
+    def email_owner(self, email):
+        return self.book.email_owner(email)
+
+    def add_contact(self, name, phone) -> Record:
+        name, phone = Name(name), Phone(phone)
+        if name.value in self.book:
+            raise NameAlreadyExists
+        elif self.book.phone_owner(phone.value):
+            raise PhoneAlreadyExists
+        record = Record(name, phone)
+        self.book.remember(name.value)
+        self.book.add_record(record)
+        return record
+
+    def update_number(self, name, phone, new_phone) -> Record:
+        record = self.existing(name)
+        new_phone = Phone(new_phone)
+        if self.book.phone_owner(new_phone.value):
+            raise PhoneAlreadyExists
+        self.book.remember(record.name.value)
+        record.update_phone(Phone(phone), new_phone)
+        self.book.record_changed(record.name.value)
+        return record
+
+    def append_number(self, name, phone) -> Record:
+        record = self.existing(name)
+        phone = Phone(phone)
+        if self.book.phone_owner(phone.value):
+            raise PhoneAlreadyExists
+        self.book.remember(record.name.value)
+        record.add_phone(phone)
+        self.book.record_changed(record.name.value)
+        return record
+
+    def delete_number(self, name, phone) -> Record:
+        record = self.existing(name)
+        phone = Phone(phone)
+        self.book.remember(record.name.value)
+        record.delete_phone(phone)
+        self.book.record_changed(record.name.value)
+        return record
+
+    def delete_contact(self, name) -> Record:
+        record = self.existing(name)
+        self.book.remember(record.name.value)
+        del self.book[record.name.value]
+        return record
+
+    def add_email(self, name, email) -> Record:
+        record = self.existing(name)
+        email = EMail(email)
+        if self.book.email_owner(email.value):
+            raise EmailAlreadyExists
+        self.book.remember(record.name.value)
+        record.add_email(email)
+        self.book.record_changed(record.name.value)
+        return record
+
+    def update_email(self, name, email, new_email) -> Record:
+        record = self.existing(name)
+        new_email = EMail(new_email)
+        if self.book.email_owner(new_email.value):
+            raise EmailAlreadyExists
+        email = EMail(email)
+        self.book.remember(record.name.value)
+        record.update_email(email, new_email)
+        self.book.record_changed(record.name.value)
+        return record
+
+    def append_email(self, name, email) -> Record:
+        record = self.existing(name)
+        email = EMail(email)
+        if self.book.email_owner(email.value):
+            raise EmailAlreadyExists
+        self.book.remember(record.name.value)
+        record.append_email(email)
+        self.book.record_changed(record.name.value)
+        return record
+
+    def delete_email(self, name, email) -> Record:
+        record = self.existing(name)
+        email = EMail(email)
+        self.book.remember(record.name.value)
+        record.delete_email(email)
+        self.book.record_changed(record.name.value)
+        return record
+
+    def add_birthday(self, name, birthday) -> Record:
+        record = self.existing(name)
+        birthday = Birthday(birthday)
+        self.book.remember(record.name.value)
+        record.add_birthday(birthday)
+        self.book.record_changed(record.name.value)
+        return record
+
+    def search(self, query) -> list:
+        return [self.book[name] for name in self.book.search(query)]
+
+    def fuzzy_search(self, name) -> list:
+        return [self.book[similar] for similar in self.book.similar_names(name)]
+
+    def upcoming_birthdays(self, days) -> list:
+        return [BirthdayMatch(self.book[name], days_to_bd)
+                for name, days_to_bd in self.book.upcoming_birthdays(days)]
+
+    def birthday_report(self, windows) -> dict:
+        return {days: [BirthdayMatch(self.book[name], days_to_bd) for name, days_to_bd in matches]
+                for days, matches in self.book.birthday_report(windows).items()}
+
+    def pages(self, size, after=None, first=None, last=None) -> PageCursor:
+        return self.book.sorted_iterator(size, after, first, last)
+
+    def import_contacts(self, path):
+        return import_contacts(Path(path).expanduser(), self.book)
+
+    def clear(self):
+        self.book.clear()
+
+
+engine = PhonebookEngine()
+
+
+class MainFunctions:
+    @staticmethod
+    @exception_handler
+    def add_contact(*args):
+        try:
+            name, phone = args[0][0], args[0][1]
+        except IndexError:
+            raise NotEnoughArguments
+        record = engine.add_contact(name, phone)
+        lang_obj().return_message('contact_added', True, record.name.value)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def update_number(*args):
+        try:
+            name, phone, new_phone = args[0][0], args[0][1], args[0][2]
+        except IndexError:
+            raise NotEnoughArguments
+        record = engine.update_number(name, phone, new_phone)
+        lang_obj().return_message('number_updated', True, record.name.value)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def append_number(*args):
+        try:
+            name, phone = args[0][0], args[0][1]
+        except IndexError:
+            raise NotEnoughArguments
+        record = engine.append_number(name, phone)
+        lang_obj().return_message('number_appended', True, phone, record.name.value)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def delete_phone_number(*args):
+        try:
+            name, phone = args[0][0], args[0][1]
+        except IndexError:
+            raise NotEnoughArguments
+        record = engine.delete_number(name, phone)
+        lang_obj().return_message('number_deleted', True, phone, record.name.value)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def delete_contact(*args):
+        try:
+            name = args[0][0]
+        except IndexError:
+            raise NotEnoughArguments
+        record = engine.delete_contact(name)
+        lang_obj().return_message('contact_deleted', True, record.name.value)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def show_all(*args):
+        SubFunctions.clear_screen()
+        lang_obj().return_message('phonebook', True)
+        total = engine.count()
+        if not total:
+            raise EmptyPhonebook
+        first = last = None
+        if args and args[0]:
+            bounds = args[0][0].title()
+            if '..' in bounds:
+                first, last = (bound or None for bound in bounds.split('..', 1))
+            else:
+                first = last = bounds.rstrip('*')
+        how_much_recs = input(lang_obj().return_message('how_much_recs', False)) if interactive else ''
+        if how_much_recs == '':
+            how_much_recs = total
+        elif not how_much_recs.lstrip('-').isdigit():
+            raise NotANumberForCountOFRecords
+        elif int(how_much_recs) <= 0:
+            lang_obj().return_message('wrong_recs_count', True, how_much_recs)
+            how_much_recs = 1
+        pages = engine.pages(int(how_much_recs), first=first, last=last)
+        page = next(pages, None)
+        while page:
+            for record in page.values():
+                lang_obj().show_record(record)
+            page = next(pages, None)
+            if interactive and page:
+                input(lang_obj().return_message('enter_to_proceed', False))
+        lang_obj().return_message('end_of_phonebook', True)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def search_command(*args) -> None:
+        SubFunctions.clear_screen()
+        if not engine.count():
+            return True
+        lang_obj().return_message('contact_search', True)
+        if args and args[0]:
+            search = ' '.join(args[0])
+        elif interactive:
+            search = input(lang_obj().return_message('search_input', False))
+        else:
+            raise NotEnoughArguments
+        found = engine.search(search)
+        for record in found:
+            lang_obj().show_found(record)
+        if not found:
+            lang_obj().return_message('not_found', True, search)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def fuzzy_search(*args):
+        SubFunctions.clear_screen()
+        if not args or not args[0]:
+            raise NotEnoughArguments
+        if not engine.count():
+            raise EmptyPhonebook
+        lang_obj().return_message('contact_search', True)
+        found = engine.fuzzy_search(' '.join(args[0]))
+        for record in found:
+            lang_obj().show_found(record)
+        if not found:
+            lang_obj().return_message('not_found', True, ' '.join(args[0]))
+        return True
+
+    @staticmethod
+    @exception_handler
+    def add_email(*args):
+        try:
+            name, email = args[0][0], args[0][1]
+        except IndexError:
+            raise NotEnoughArguments
+        record = engine.add_email(name, email)
+        lang_obj().return_message('email_added', True, email, record.name.value)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def update_email(*args):
+        try:
+            name, email, new_email = args[0][0], args[0][1], args[0][2]
+        except IndexError:
+            raise NotEnoughArguments
+        try:
+            record = engine.update_email(name, email, new_email)
+        except TypeError:
+            raise NoEmailUpdateTo
+        lang_obj().return_message('email_updated', True, email, record.name.value)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def append_email(*args):
+        try:
+            name, email = args[0][0], args[0][1]
+        except IndexError:
+            raise NotEnoughArguments
+        record = engine.append_email(name, email)
+        lang_obj().return_message('email_appended', True, email, record.name.value)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def delete_email(*args):
+        try:
+            name, email = args[0][0], args[0][1]
+        except IndexError:
+            raise NotEnoughArguments
+        record = engine.delete_email(name, email)
+        lang_obj().return_message('email_deleted', True, email, record.name.value)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def add_birthday(*args):
+        try:
+            name, birthday = args[0][0], args[0][1]
+        except IndexError:
+            raise NotEnoughArguments
+        record = engine.add_birthday(name, birthday)
+        lang_obj().return_message('bd_added', True, birthday, record.name.value)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def near_bd(*args):
+        try:
+            windows = [int(days) for days in args[0]]
+        except (IndexError, ValueError):
+            windows = []
+        if not windows:
+            lang_obj().return_message('no_number_of_days_to_search', True)
+            return False
+        if not engine.count():
+            raise EmptyPhonebook
+        lang_obj().return_message('search_for_bd', True)
+        for days, matches in engine.birthday_report(windows).items():
+            if len(windows) > 1:
+                lang_obj().return_message('bd_window', True, str(days))
+            for match in matches:
+                lang_obj().return_message('bd_search_result', True, match.record.name.value,
+                                          str(match.record.birthday), str(match.days))
+        lang_obj().return_message('search_result', True)
+        return True
+
+    @staticmethod
+    @exception_handler
+    def import_contacts(*args):
+        if not args or not args[0]:
+            raise NotEnoughArguments
+        imported, rejected = 0, 0
+        for position, error in engine.import_contacts(' '.join(args[0])):
+            if error:
+                rejected += 1
+                lang_obj().return_message('import_rejected', True, str(position),
+                                          lang_obj().return_error(error, False).strip('-\n|'))
+            else:
+                imported += 1
+        lang_obj().return_message('import_result', True, str(imported), str(rejected))
+        return True
+
+    @staticmethod
+    def clear_phonebook(*args):
+        if args and args[0]:
+            ask = args[0][0]
+        elif interactive:
+            ask = input(lang_obj().return_message('clear_phonebook', False))
+        else:
+            ask = 'n'
+        if ask == 'y':
+            engine.clear()
+            lang_obj().return_message('phonebook_cleared', True)
+        else:
+            lang_obj().return_message('phonebook_not_cleared', True)
+
+
+class SubFunctions:
+    @staticmethod
+    def top_secret(*args):
+        SubFunctions.clear_screen()
+        print('Ok, you asked for it.')
+        pause(2)
+        print('Folder System32 deleting is initiated.')
+        pause(1)
+        print('Say goodbye to your computer.')
+        pause(1)
+        print('Starting deletion...')
+        pause(3)
+        print('10...')
+        pause(1)
+        print('9...')
+        pause(1)
+        print('8...')
+        pause(1)
+        print('7...')
+        pause(1)
+        print('6...')
+        pause(1)
+        print('5...')
+        pause(1)
+        print('You still think this is a joke?')
+        pause(1)
+        print('3...')
+        pause(1)
+        print('2...')
+        pause(1)
+        print('1...')
+        pause(3)
+        print('0...')
+        pause(3)
+        print('Folder System32 deleted.')
+        pause(1)
         print('Or not?')
-        time.sleep(1)
+        pause(1)
         print('Just in case, do not try to swear anymore, ok?')
-        time.sleep(1.5)
+        pause(1.5)
 
     @staticmethod
     def goodbye(*args) -> None:
@@ -903,7 +2180,20 @@ class SubFunctions:
         for message in so_long:
             print(choice(so_long))
             break
-        time.sleep(1)
+        pause(1)
+
+    @staticmethod
+    def stats(*args) -> None:
+        bloom = address_book.bloom
+        if bloom is not None:
+            lang_obj().return_message('bloom_stats', True, str(bloom.checks), str(bloom.saved),
+                                      str(bloom.false_positives), str(bloom.count), str(bloom.error_rate))
+        if command_stats is None:
+            lang_obj().return_message('stats_disabled', True)
+            return
+        lang_obj().return_message('stats_header', True)
+        for line in command_stats.report():
+            print(line)
 
     @staticmethod
     def help_command(*args) -> None:
@@ -913,11 +2203,13 @@ class SubFunctions:
     def greetings(*args) -> None:
         SubFunctions.clear_screen()
         lang_obj().return_message('greeting', True)
-        time.sleep(2)
+        pause(2)
         SubFunctions.help_command()
 
     @staticmethod
     def clear_screen(*args) -> None:
+        if not interactive:
+            return
         os.system('cls' if os.name == 'nt' else 'clear')
 
     @staticmethod
@@ -947,41 +2239,1404 @@ class SubFunctions:
 ...
 
 
-def upload_check():
-    if not os.path.exists(Path(Path.home(), 'Documents', 'PyBakers', 'database')):
-        os.makedirs(Path(Path.home(), 'Documents', 'PyBakers', 'database'))
+DATABASE_DIR = Path(Path.home(), 'Documents', 'PyBakers', 'database')
+PHONEBOOK_FILE = Path(DATABASE_DIR, 'data_with_contacts.bin')
+JOURNAL_FILE = Path(DATABASE_DIR, 'data_with_contacts.journal')
+SQLITE_FILE = Path(DATABASE_DIR, 'data_with_contacts.sqlite3')
+MAPPED_FILE = Path(DATABASE_DIR, 'data_with_contacts.pbs')
+MAPPED_JOURNAL_FILE = Path(DATABASE_DIR, 'data_with_contacts.pbs.journal')
+SHARDS_DIR = Path(DATABASE_DIR, 'shards')
+SHARD_COUNT = 64
+RESIDENT_SHARDS = 8
+JOURNAL_COMPACT_SIZE = 1024 * 1024
+
+
+def write_snapshot(path, data):
+    tmp_path = Path(f'{path}.tmp')
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_journal(path):
     try:
-        with open(Path(Path.home(), 'Documents', 'PyBakers', 'database', 'data_with_contacts.bin'), 'rb') as f:
-            address_book.data = pickle.load(f)
+        f = open(path, 'rb')
     except FileNotFoundError:
-        pass
-    except ModuleNotFoundError:
-        print("Preparing some stuff for you...")
-        pass
-    finally:
-        with open(Path(Path.home(), 'Documents', 'PyBakers', 'database', 'data_with_contacts.bin'), 'wb') as f:
-            pickle.dump(address_book.data, f)
+        return
+    with f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                # The tail of the journal may be torn by a crash mid-append.
+                break
 
 
-def save_phonebook():
-    with open(Path(Path.home(), 'Documents', 'PyBakers', 'database', 'data_with_contacts.bin'), 'wb') as f:
-        pickle.dump(address_book.data, f)
+class Journal:
+    """
+    Append-only log of record changes written on top of the snapshot.
 
+    Every entry is a pickled tuple: ('put', name, record), ('del', name) or ('clear',).
+    Once the journal grows past compact_size it is moved aside and a background
+    thread folds it into a fresh snapshot, so commands never rewrite the whole book.
+    """
 
-...
+    def __init__(self, path, snapshot_path, compact_size=JOURNAL_COMPACT_SIZE):
+        self.path = Path(path)
+        self.old_path = Path(f'{path}.old')
+        self.snapshot_path = Path(snapshot_path)
+        self.compact_size = compact_size
+        self.file = None
+        self.compactor = None
+
+    @staticmethod
+    def load_snapshot(path):
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def dump_snapshot(path, data):
+        write_snapshot(path, data)
+
+    @staticmethod
+    def apply(data, entry):
+        if entry[0] == 'put':
+            data[entry[1]] = entry[2]
+        elif entry[0] == 'del':
+            data.pop(entry[1], None)
+        elif entry[0] == 'clear':
+            data.clear()
+
+    @classmethod
+    def read_book(cls, path, snapshot_path) -> dict:
+        """
+        The book as the snapshot plus the changes journaled after it, without opening the journal for writing.
+        """
+        data = cls.load_snapshot(snapshot_path)
+        cls(path, snapshot_path).replay(data)
+        return data
+
+    def replay(self, data) -> int:
+        count = 0
+        for path in (self.old_path, self.path):
+            for entry in read_journal(path):
+                self.apply(data, entry)
+                count += 1
+        return count
+
+    def open(self):
+        self.file = open(self.path, 'ab')
+
+    def append(self, *entry):
+        pickle.dump(entry, self.file)
+
+    def flush(self):
+        self.file.flush()
+        if self.file.tell() >= self.compact_size:
+            self.compact()
+
+    def compact(self):
+        # A journal moved aside stays there until its fold succeeds or a checkpoint takes it in;
+        # moving the next one over it would lose the changes it holds.
+        if self.compactor and self.compactor.is_alive() or os.path.exists(self.old_path):
+            return
+        self.file.close()
+        os.replace(self.path, self.old_path)
+        self.open()
+        self.compactor = threading.Thread(target=self.fold, args=(self.snapshot_path, self.old_path))
+        self.compactor.start()
+
+    @classmethod
+    def fold(cls, snapshot_path, old_path):
+        data = cls.load_snapshot(snapshot_path)
+        for entry in read_journal(old_path):
+            cls.apply(data, entry)
+        cls.dump_snapshot(snapshot_path, data)
+        os.remove(old_path)
+
+    def wait(self):
+        if self.compactor:
+            self.compactor.join()
+            self.compactor = None
+
+    def checkpoint(self, data):
+        self.wait()
+        self.dump_snapshot(self.snapshot_path, data)
+        if self.file:
+            self.file.close()
+        if os.path.exists(self.old_path):
+            os.remove(self.old_path)
+        open(self.path, 'wb').close()
+        self.open()
+
+    def close(self):
+        self.wait()
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class SQLiteRecords(MutableMapping):
+    """
+    Mapping over the records table. Recently read records stay cached as live objects,
+    so in-place edits made by MainFunctions are what record_changed writes back.
+    """
+    cache_size = 1024
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cache = OrderedDict()
+
+    def remember(self, name, record):
+        self.cache[name] = record
+        self.cache.move_to_end(name)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def build(self, name, birthday) -> Record:
+        record = Record(Name(name), birthday=Birthday(birthday) if birthday else None)
+        phones = self.connection.execute(
+            'SELECT phone, phone_key FROM phones WHERE name = ? ORDER BY position', (name,)).fetchall()
+        record.phones = tuple(phone for phone, _ in phones)
+        record.phone_keys = tuple(int(key) for _, key in phones)
+        record.emails = tuple(row[0] for row in self.connection.execute(
+            'SELECT email FROM emails WHERE name = ? ORDER BY position', (name,)))
+        return record
+
+    def __getitem__(self, name):
+        if name in self.cache:
+            self.cache.move_to_end(name)
+            return self.cache[name]
+        row = self.connection.execute('SELECT birthday FROM records WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        record = self.build(name, row[0])
+        self.remember(name, record)
+        return record
+
+    def __setitem__(self, name, record):
+        self.remember(name, record)
+        self.write(name, record)
+
+    def write(self, name, record):
+        birthday = record.birthday.value if record.birthday and record.birthday.value else None
+        month, day = (int(part) for part in birthday.split('.')[1::-1]) if birthday else (None, None)
+        self.connection.execute(
+            'INSERT INTO records (name, birthday, bd_month, bd_day) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET birthday = excluded.birthday, '
+            'bd_month = excluded.bd_month, bd_day = excluded.bd_day',
+            (name, birthday, month, day))
+        self.connection.execute('DELETE FROM phones WHERE name = ?', (name,))
+        self.connection.executemany(
+            'INSERT INTO phones (name, position, phone, phone_key) VALUES (?, ?, ?, ?)',
+            [(name, i, phone, key) for i, (phone, key) in enumerate(zip(record.phones, record.phone_keys))])
+        self.connection.execute('DELETE FROM emails WHERE name = ?', (name,))
+        self.connection.executemany(
+            'INSERT INTO emails (name, position, email, email_key) VALUES (?, ?, ?, ?)',
+            [(name, i, email, normalize_email(email)) for i, email in enumerate(record.emails)])
+        record_id = self.connection.execute('SELECT id FROM records WHERE name = ?', (name,)).fetchone()[0]
+        self.connection.execute('DELETE FROM search_terms WHERE rowid = ?', (record_id,))
+        self.connection.execute('INSERT INTO search_terms (rowid, terms) VALUES (?, ?)',
+                                (record_id, '\n'.join(search_terms(record))))
+
+    def __delitem__(self, name):
+        self.cache.pop(name, None)
+        row = self.connection.execute('SELECT id FROM records WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        self.connection.execute('DELETE FROM search_terms WHERE rowid = ?', row)
+        self.connection.execute('DELETE FROM records WHERE id = ?', row)
+
+    def __contains__(self, name):
+        return name in self.cache or self.connection.execute(
+            'SELECT 1 FROM records WHERE name = ?', (name,)).fetchone() is not None
+
+    def __iter__(self):
+        for row in self.connection.execute('SELECT name FROM records ORDER BY id'):
+            yield row[0]
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def clear(self):
+        self.cache.clear()
+        for table in ('phones', 'emails', 'search_terms', 'records'):
+            self.connection.execute(f'DELETE FROM {table}')
+
+
+class SQLiteAddressBook(AddressBook):
+    """
+    AddressBook stored in SQLite. Duplicate checks, search and near_bd run as indexed queries,
+    so the book is never loaded into memory as a whole. Every change is committed by SQLite itself,
+    so write_behind is ignored. The first open brings over a book kept by the pickle backend.
+    """
+    concurrent_reads = False
+    schema = '''
+        CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            birthday TEXT,
+            bd_month INTEGER,
+            bd_day INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS phones (
+            name TEXT NOT NULL REFERENCES records(name) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            phone TEXT NOT NULL,
+            phone_key INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS emails (
+            name TEXT NOT NULL REFERENCES records(name) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            email TEXT NOT NULL,
+            email_key TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS records_birthday ON records(bd_month, bd_day);
+        CREATE INDEX IF NOT EXISTS phones_name ON phones(name);
+        CREATE INDEX IF NOT EXISTS phones_key ON phones(phone_key);
+        CREATE INDEX IF NOT EXISTS emails_name ON emails(name);
+        CREATE INDEX IF NOT EXISTS emails_key ON emails(email_key);
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    '''
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.indexes = []
+        self.path = path
+        self.connection = None
+        self.full_text = False
+
+    def open(self, journaled=True, write_behind=None):
+        self.connection = sqlite3.connect(self.path or SQLITE_FILE, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(self.schema)
+        try:
+            self.connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_terms USING fts5(terms, tokenize='trigram')")
+            self.full_text = True
+        except sqlite3.OperationalError:
+            # FTS5 trigrams need SQLite 3.34+, older builds scan a plain table instead.
+            self.connection.execute('CREATE TABLE IF NOT EXISTS search_terms (id INTEGER PRIMARY KEY, terms TEXT)')
+        row = self.connection.execute("SELECT value FROM settings WHERE key = 'phone_keys'").fetchone()
+        if row is None or row[0] != str(PHONE_KEYS_VERSION):
+            self.rekey_phones()
+        self.connection.commit()
+        self.data = SQLiteRecords(self.connection)
+        if self.connection.execute("SELECT 1 FROM settings WHERE key = 'pickle_imported'").fetchone() is None:
+            self.import_pickle()
+
+    def import_pickle(self):
+        """
+        Copies the snapshot and journal of the pickle backend into a database that has no records yet.
+        The marker keeps a book emptied later on from being filled again.
+        """
+        empty = self.connection.execute('SELECT 1 FROM records LIMIT 1').fetchone() is None
+        if empty and os.path.exists(PHONEBOOK_FILE):
+            for name, record in Journal.read_book(JOURNAL_FILE, PHONEBOOK_FILE).items():
+                self.data.write(name, record)
+        self.connection.execute("INSERT INTO settings (key, value) VALUES ('pickle_imported', '1')")
+        self.commit()
+
+    def rekey_phones(self):
+        """
+        Recomputes the phone keys of a database written by an older version with the current country defaults.
+        """
+        self.connection.create_function('phone_key', 1, phone_key, deterministic=True)
+        self.connection.execute('UPDATE phones SET phone_key = phone_key(phone)')
+        self.connection.execute("INSERT INTO settings (key, value) VALUES ('phone_keys', ?) "
+                                "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (str(PHONE_KEYS_VERSION),))
+
+    def commit(self):
+        self.connection.commit()
+
+    def save(self):
+        self.connection.commit()
+
+    def close(self):
+        if self.connection:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    def load(self, data):
+        self.data.clear()
+        for name, record in data.items():
+            self.data.write(name, record)
+        self.commit()
+
+    @bloom_checked('tel:', phone_key)
+    def phone_owner(self, phone):
+        row = self.connection.execute('SELECT name FROM phones WHERE phone_key = ? LIMIT 1',
+                                      (phone_key(phone),)).fetchone()
+        return row[0] if row else None
+
+    @bloom_checked('mail:', normalize_email)
+    def email_owner(self, email):
+        row = self.connection.execute('SELECT name FROM emails WHERE email_key = ? LIMIT 1',
+                                      (normalize_email(email),)).fetchone()
+        return row[0] if row else None
+
+    def search(self, query) -> list:
+        pattern = compile_search(query)
+        fragments = [fragment for fragment in literal_fragments(query) if len(fragment) >= 3]
+        if self.full_text and fragments:
+            match = ' AND '.join('"{}"'.format(fragment.replace('"', '""')) for fragment in fragments)
+            rows = self.connection.execute('SELECT records.name, search_terms.terms FROM search_terms '
+                                           'JOIN records ON records.id = search_terms.rowid '
+                                           'WHERE search_terms MATCH ?', (match,))
+        else:
+            rows = self.connection.execute('SELECT records.name, search_terms.terms FROM search_terms '
+                                           'JOIN records ON records.id = search_terms.rowid')
+        return sorted(name for name, terms in rows if any(pattern.search(term) for term in terms.split('\n')))
+
+    def upcoming_birthdays(self, days, today=None) -> list:
+        result = []
+        for offset, (month, day) in birthday_window(today or datetime.now().date(), days):
+            rows = self.connection.execute('SELECT name FROM records WHERE bd_month = ? AND bd_day = ? ORDER BY name',
+                                           (month, day))
+            result.extend((row[0], offset) for row in rows)
+        return result
+
+    def names_between(self, first=None, last=None, after=None):
+        conditions, parameters = [], []
+        if first is not None:
+            conditions.append('name >= ?')
+            parameters.append(first)
+        if last is not None:
+            conditions.append('name < ?')
+            parameters.append(last + '\U0010ffff')
+        if after is not None:
+            conditions.append('name > ?')
+            parameters.append(after)
+        where = f'WHERE {" AND ".join(conditions)} ' if conditions else ''
+        for row in self.connection.execute(f'SELECT name FROM records {where}ORDER BY name', parameters):
+            yield row[0]
+
+    def record_changed(self, name):
+        record = self.data.cache.get(name)
+        if record is not None:
+            self.data.write(name, record)
+            self.bloom_add(record)
+
+    def __setitem__(self, key, item):
+        self.data[key] = item
+        self.bloom_add(item)
+        if self.fuzzy_index is not None:
+            self.fuzzy_index.add(key, item)
+
+    def __delitem__(self, key):
+        del self.data[key]
+        if self.fuzzy_index is not None:
+            self.fuzzy_index.discard(key)
+
+
+SNAPSHOT_MAGIC = b'PBSNAP'
+SNAPSHOT_VERSION = 2
+# magic, version, records, phone keys, email keys, birthdays, then the offset of every section
+SNAPSHOT_HEADER = struct.Struct('<6sH4I5Q')
+# name (pool offset, length), phones, emails and phone keys (pool offset, length), birthday ordinal or 0
+SNAPSHOT_RECORD = struct.Struct('<IIIIi')
+# phone or email key (pool offset, length), record position
+SNAPSHOT_KEY = struct.Struct('<III')
+# month * 32 + day, record position
+SNAPSHOT_BIRTHDAY = struct.Struct('<HI')
+
+
+def write_mapped_snapshot(path, data):
+    """
+    Writes data as a binary snapshot: a header, a record table sorted by name, sorted phone,
+    email and birthday tables pointing into it, and a pool with the UTF-8 strings.
+    path must not be mapped: Windows refuses to replace a file with an open map.
+    """
+    pool = bytearray()
+
+    def put(text):
+        raw = text.encode('utf-8')
+        pool.extend(raw)
+        return len(pool) - len(raw), len(raw)
+
+    records, phones, emails, birthdays = bytearray(), [], [], []
+    for position, name in enumerate(sorted(data)):
+        record = data[name]
+        bd = record.birthday.date if record.birthday else None
+        records += SNAPSHOT_RECORD.pack(*put(name),
+                                        *put('\x1e'.join(('\x1f'.join(record.phones), '\x1f'.join(record.emails),
+                                                          '\x1f'.join(map(str, record.phone_keys))))),
+                                        bd.toordinal() if bd else 0)
+        phones.extend((str(key).encode('utf-8'), position) for key in record.phone_keys)
+        emails.extend((normalize_email(email).encode('utf-8'), position) for email in record.emails)
+        if bd:
+            birthdays.append((bd.month * 32 + bd.day, position))
+
+    def key_table(keys):
+        table = bytearray()
+        for key, position in sorted(keys):
+            table += SNAPSHOT_KEY.pack(len(pool), len(key), position)
+            pool.extend(key)
+        return table
+
+    phone_table, email_table = key_table(phones), key_table(emails)
+    birthday_table = b''.join(SNAPSHOT_BIRTHDAY.pack(*entry) for entry in sorted(birthdays))
+    sections = [records, phone_table, email_table, birthday_table, pool]
+    offsets, offset = [], SNAPSHOT_HEADER.size
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    tmp_path = Path(f'{path}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(data), len(phones), len(emails),
+                                     len(birthdays), *offsets))
+        for section in sections:
+            f.write(section)
+    os.replace(tmp_path, path)
+
+
+class MappedSnapshot:
+    """
+    Read-only view of a binary snapshot through mmap. Records are decoded one at a time when
+    asked for and lookups binary-search the sorted tables, so opening costs nothing per record.
+    """
+
+    def __init__(self, path=None):
+        self.map = None
+        self.count = self.phone_count = self.email_count = self.birthday_count = 0
+        self.records = self.phones = self.emails = self.birthdays = self.pool = 0
+        self.version = SNAPSHOT_VERSION
+        if path is None:
+            return
+        with open(path, 'rb') as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise UnsupportedSnapshot
+        if len(self.map) < SNAPSHOT_HEADER.size:
+            self.close()
+            raise UnsupportedSnapshot
+        (magic, self.version, self.count, self.phone_count, self.email_count, self.birthday_count,
+         self.records, self.phones, self.emails, self.birthdays, self.pool) = SNAPSHOT_HEADER.unpack_from(self.map)
+        if magic != SNAPSHOT_MAGIC or self.version not in (1, SNAPSHOT_VERSION):
+            self.close()
+            raise UnsupportedSnapshot
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def raw(self, offset, length) -> bytes:
+        return self.map[self.pool + offset:self.pool + offset + length]
+
+    def entry(self, position):
+        return SNAPSHOT_RECORD.unpack_from(self.map, self.records + position * SNAPSHOT_RECORD.size)
+
+    def name(self, position) -> str:
+        name_offset, name_length, _, _, _ = self.entry(position)
+        return self.raw(name_offset, name_length).decode('utf-8')
+
+    def names(self):
+        for position in range(self.count):
+            yield self.name(position)
+
+    def bisect(self, name, right=False) -> int:
+        key, low, high = name.encode('utf-8'), 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            name_offset, name_length, _, _, _ = self.entry(middle)
+            found = self.raw(name_offset, name_length)
+            if found < key or (right and found == key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def position(self, name):
+        low = self.bisect(name)
+        if low < self.count and self.name(low) == name:
+            return low
+        return None
+
+    def values(self, position):
+        """
+        Phones, emails, phone keys (None in version 1 snapshots) and the birthday ordinal of a record.
+        """
+        _, _, values_offset, values_length, ordinal = self.entry(position)
+        phones, emails, *keys = self.raw(values_offset, values_length).decode('utf-8').split('\x1e')
+        keys = tuple(int(key) for key in keys[0].split('\x1f') if key) if keys else None
+        return phones.split('\x1f') if phones else [], emails.split('\x1f') if emails else [], keys, ordinal
+
+    def record(self, position) -> Record:
+        phones, emails, keys, ordinal = self.values(position)
+        name = Name.__new__(Name)
+        name.__setstate__((self.name(position),))
+        birthday = None
+        if ordinal:
+            birthday = Birthday.__new__(Birthday)
+            birthday.__setstate__((ordinal,))
+        record = Record.__new__(Record)
+        state = (name, phones, emails, birthday)
+        record.__setstate__(state if keys is None else (*state, keys))
+        return record
+
+    def owner(self, table, count, key):
+        key, low, high = key.encode('utf-8'), 0, count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, position = SNAPSHOT_KEY.unpack_from(self.map, table + middle * SNAPSHOT_KEY.size)
+            found = self.raw(key_offset, key_length)
+            if found == key:
+                return self.name(position)
+            elif found < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def phone_owner(self, key):
+        return self.owner(self.phones, self.phone_count, str(key))
+
+    def email_owner(self, key):
+        return self.owner(self.emails, self.email_count, key)
+
+    def birthday_names(self, month, day) -> list:
+        key, low, high = month * 32 + day, 0, self.birthday_count
+        while low < high:
+            middle = (low + high) // 2
+            if SNAPSHOT_BIRTHDAY.unpack_from(self.map, self.birthdays + middle * SNAPSHOT_BIRTHDAY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        names = []
+        for index in range(low, self.birthday_count):
+            found, position = SNAPSHOT_BIRTHDAY.unpack_from(self.map, self.birthdays + index * SNAPSHOT_BIRTHDAY.size)
+            if found != key:
+                break
+            names.append(self.name(position))
+        return names
+
+    def terms(self):
+        """
+        Yields (name, search terms) for every record without building Record objects.
+        """
+        for position in range(self.count):
+            name = self.name(position)
+            phones, emails, _, _ = self.values(position)
+            yield name, [name.lower(), *phones, *(email.lower() for email in emails)]
+
+
+class SnapshotRecords(MutableMapping):
+    """
+    Mapping over a MappedSnapshot with the changes made since it was written kept in memory:
+    changed holds new and modified records, deleted the snapshot names that are gone.
+    """
+
+    def __init__(self, snapshot, cache_size=1024):
+        self.snapshot = snapshot
+        self.changed = {}
+        self.deleted = set()
+        self.added = set()
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.dirty = False
+
+    def shadowed(self, name) -> bool:
+        return name in self.changed or name in self.deleted
+
+    def __getitem__(self, name):
+        if name in self.changed:
+            return self.changed[name]
+        if name in self.cache:
+            self.cache.move_to_end(name)
+            return self.cache[name]
+        position = None if name in self.deleted else self.snapshot.position(name)
+        if position is None:
+            raise KeyError(name)
+        record = self.snapshot.record(position)
+        self.cache[name] = record
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return record
+
+    def __setitem__(self, name, record):
+        if name not in self.changed and self.snapshot.position(name) is None:
+            self.added.add(name)
+        self.deleted.discard(name)
+        self.cache.pop(name, None)
+        self.changed[name] = record
+        self.dirty = True
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self.changed.pop(name, None)
+        self.cache.pop(name, None)
+        if name in self.added:
+            self.added.discard(name)
+        else:
+            self.deleted.add(name)
+        self.dirty = True
+
+    def __contains__(self, name):
+        return name in self.changed or (name not in self.deleted and self.snapshot.position(name) is not None)
+
+    def __iter__(self):
+        for name in self.snapshot.names():
+            if name not in self.deleted:
+                yield name
+        yield from (name for name in self.changed if name in self.added)
+
+    def __len__(self):
+        return self.snapshot.count - len(self.deleted) + len(self.added)
+
+    def clear(self):
+        self.snapshot.close()
+        self.snapshot = MappedSnapshot()
+        self.changed.clear()
+        self.deleted.clear()
+        self.added.clear()
+        self.cache.clear()
+        self.dirty = True
 
 
-def command_parser(command: str) -> None:
-    for func, call in main_commands.items():
-        for word in call:
-            if command.startswith(word):
-                arguments = command.replace(word, '').split()
-                func(arguments)
+class MappedJournal(Journal):
+    """
+    Journal over a binary snapshot instead of a pickled one. The book keeps the snapshot mapped,
+    so new snapshots go to pending_path and install() moves them into place once the map is closed.
+    The background fold only writes the pending file; the book installs it on its next commit.
+    """
+
+    def __init__(self, path, snapshot_path, compact_size=JOURNAL_COMPACT_SIZE):
+        super().__init__(path, snapshot_path, compact_size)
+        self.pending_path = self.pending(snapshot_path)
+
+    @staticmethod
+    def pending(snapshot_path):
+        return Path(f'{snapshot_path}.new')
+
+    @staticmethod
+    def load_snapshot(path):
+        return SnapshotRecords(MappedSnapshot(path) if os.path.exists(path) else MappedSnapshot())
+
+    @staticmethod
+    def dump_snapshot(path, data):
+        write_mapped_snapshot(path, data)
+
+    @classmethod
+    def fold(cls, snapshot_path, old_path):
+        data = cls.load_snapshot(snapshot_path)
+        for entry in read_journal(old_path):
+            cls.apply(data, entry)
+        cls.dump_snapshot(cls.pending(snapshot_path), data)
+        data.snapshot.close()
+
+    def folded(self, wait=False) -> bool:
+        if self.compactor is None:
+            return False
+        if wait:
+            self.compactor.join()
+        return not self.compactor.is_alive()
+
+    def install(self):
+        """
+        Moves the pending snapshot over the old one, which the caller must have unmapped.
+        """
+        self.wait()
+        if os.path.exists(self.pending_path):
+            os.replace(self.pending_path, self.snapshot_path)
+            if os.path.exists(self.old_path):
+                os.remove(self.old_path)
+
+    def checkpoint(self, data, release=None):
+        self.wait()
+        self.dump_snapshot(self.pending_path, data)
+        if release is not None:
+            release()
+        self.install()
+        if self.file:
+            self.file.close()
+        open(self.path, 'wb').close()
+        self.open()
+
+
+class MappedAddressBook(AddressBook):
+    """
+    AddressBook opened straight from a memory-mapped binary snapshot. Only records that are
+    looked up get decoded; the in-memory indexes cover just the records changed since the
+    snapshot was written, everything else is answered from the snapshot's sorted tables.
+    """
+    concurrent_reads = False
+
+    def __init__(self, path=None, journal_path=None):
+        super().__init__()
+        self.path = path
+        self.journal_path = journal_path
+        self.birthday_index = BirthdayIndex()
+        self.indexes = [self.phone_index, self.email_index, self.birthday_index, self.name_index]
+        self.data = SnapshotRecords(MappedSnapshot())
+
+    def open(self, journaled=True, write_behind=None):
+        path = self.path or MAPPED_FILE
+        journal = MappedJournal(self.journal_path or MAPPED_JOURNAL_FILE, path)
+        self.data = journal.load_snapshot(path)
+        migrated = False
+        if not os.path.exists(path) and os.path.exists(PHONEBOOK_FILE):
+            self.data.update(Journal.read_book(JOURNAL_FILE, PHONEBOOK_FILE))
+            migrated = True
+        replayed = journal.replay(self.data)
+        self.reindex()
+        outdated = self.data.snapshot.version < SNAPSHOT_VERSION
+        if migrated or replayed or outdated or not os.path.exists(path):
+            journal.checkpoint(self.data, self.data.snapshot.close)
+            self.remap()
+        if journaled:
+            if not journal.file:
+                journal.open()
+            self.journal = journal
+        else:
+            journal.close()
+
+    def reindex(self):
+        for index in self.indexes:
+            index.clear()
+            for name, record in self.data.changed.items():
+                index.add(name, record)
+
+    def remap(self):
+        self.data.snapshot.close()
+        self.data = SnapshotRecords(MappedSnapshot(self.path or MAPPED_FILE))
+        self.reindex()
+
+    def commit(self):
+        super().commit()
+        if self.journal and self.journal.folded():
+            self.install_fold()
+
+    def install_fold(self):
+        """
+        Maps the snapshot folded by the background compactor and replays what was journaled since.
+        """
+        self.data.snapshot.close()
+        self.journal.install()
+        self.data = self.journal.load_snapshot(self.path or MAPPED_FILE)
+        self.journal.replay(self.data)
+        self.reindex()
+
+    def save(self):
+        if not self.data.dirty:
+            return
+        if self.journal:
+            self.journal.checkpoint(self.data, self.data.snapshot.close)
+        else:
+            path = self.path or MAPPED_FILE
+            pending = MappedJournal.pending(path)
+            write_mapped_snapshot(pending, self.data)
+            self.data.snapshot.close()
+            os.replace(pending, path)
+        self.remap()
+
+    def close(self):
+        folded = self.journal is not None and self.journal.folded(wait=True)
+        super().close()
+        self.data.snapshot.close()
+        if folded:
+            self.journal.install()
+
+    @bloom_checked('tel:', phone_key)
+    def phone_owner(self, phone):
+        key = phone_key(phone)
+        owner = self.phone_index.get(key)
+        if owner is None:
+            owner = self.data.snapshot.phone_owner(key)
+            if owner is not None and self.data.shadowed(owner):
                 return None
-            continue
+        return owner
+
+    @bloom_checked('mail:', normalize_email)
+    def email_owner(self, email):
+        key = normalize_email(email)
+        owner = self.email_index.get(key)
+        if owner is None:
+            owner = self.data.snapshot.email_owner(key)
+            if owner is not None and self.data.shadowed(owner):
+                return None
+        return owner
+
+    def search(self, query) -> list:
+        """
+        The snapshot has no trigram table, so records in it are scanned term by term without being decoded
+        into Record objects; only the changed records are matched in memory.
+        """
+        pattern = compile_search(query)
+        names = [name for name, terms in self.data.snapshot.terms()
+                 if not self.data.shadowed(name) and any(pattern.search(term) for term in terms)]
+        names.extend(name for name, record in self.data.changed.items()
+                     if any(pattern.search(term) for term in search_terms(record)))
+        return sorted(names)
+
+    def upcoming_birthdays(self, days, today=None) -> list:
+        result = []
+        for offset, (month, day) in birthday_window(today or datetime.now().date(), days):
+            names = {name for name in self.data.snapshot.birthday_names(month, day) if not self.data.shadowed(name)}
+            names.update(self.birthday_index.buckets.get((month, day), ()))
+            result.extend((name, offset) for name in sorted(names))
+        return result
+
+    def names_between(self, first=None, last=None, after=None):
+        snapshot, start = self.data.snapshot, 0
+        if first is not None:
+            start = max(start, snapshot.bisect(first))
+        if after is not None:
+            start = max(start, snapshot.bisect(after, right=True))
+        stop = snapshot.count if last is None else snapshot.bisect(last + '\U0010ffff')
+        stored = (name for name in map(snapshot.name, range(start, stop)) if name not in self.data.deleted)
+        added = (name for name in self.name_index.between(first, last, after) if name in self.data.added)
+        return heapq.merge(stored, added)
+
+    def record_changed(self, name):
+        record = self.data.get(name)
+        if record is not None:
+            self.data[name] = record
+        super().record_changed(name)
+
+
+class ShardStore(MutableMapping):
+    """
+    Mapping hash-partitioned by crc32 of the key over pickled shard files in a directory.
+    Up to `resident` clean shards stay in memory, least recently used ones are dropped first;
+    changed shards are kept until flush(), which rewrites only those.
+    manifest.json keeps the shard count, the number of keys in every shard and the owner's meta dict.
+    """
+
+    def __init__(self, directory, count=SHARD_COUNT, resident=RESIDENT_SHARDS):
+        self.directory = Path(directory)
+        self.count = count
+        self.resident = resident
+        self.shards = OrderedDict()
+        self.dirty = set()
+        self.counts = [0] * count
+        self.meta = {}
+        manifest = Path(self.directory, 'manifest.json')
+        if manifest.exists():
+            with open(manifest, encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.count, self.counts = manifest['shards'], manifest['counts']
+            self.meta = manifest.get('meta', {})
+
+    def path(self, index) -> Path:
+        return Path(self.directory, f'shard_{index:03d}.bin')
+
+    def index(self, key) -> int:
+        return zlib.crc32(str(key).encode('utf-8')) % self.count
+
+    def shard(self, index) -> dict:
+        if index in self.shards:
+            self.shards.move_to_end(index)
+            return self.shards[index]
+        try:
+            with open(self.path(index), 'rb') as f:
+                shard = pickle.load(f)
+        except FileNotFoundError:
+            shard = {}
+        self.shards[index] = shard
+        clean = [resident for resident in self.shards if resident not in self.dirty and resident != index]
+        for evicted in clean[:max(len(self.shards) - self.resident, 0)]:
+            del self.shards[evicted]
+        return shard
+
+    def write(self, index):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_snapshot(self.path(index), self.shards[index])
+        self.dirty.discard(index)
+
+    def write_manifest(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(self.directory, 'manifest.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'shards': self.count, 'counts': self.counts, 'meta': self.meta}, f)
+        os.replace(tmp_path, Path(self.directory, 'manifest.json'))
+
+    def flush(self):
+        if not self.dirty:
+            return
+        for index in sorted(self.dirty):
+            self.write(index)
+        self.write_manifest()
+
+    def recount(self):
+        self.counts = [len(self.shard(index)) for index in range(self.count)]
+
+    def shard_keys(self):
+        """
+        Yields the keys of every non-empty shard, one shard at a time.
+        """
+        for index in range(self.count):
+            if self.counts[index]:
+                yield list(self.shard(index))
+
+    def __getitem__(self, key):
+        return self.shard(self.index(key))[key]
+
+    def __setitem__(self, key, value):
+        index = self.index(key)
+        shard = self.shard(index)
+        if key not in shard:
+            self.counts[index] += 1
+        shard[key] = value
+        self.dirty.add(index)
+
+    def __delitem__(self, key):
+        index = self.index(key)
+        del self.shard(index)[key]
+        self.counts[index] -= 1
+        self.dirty.add(index)
+
+    def __contains__(self, key):
+        return key in self.shard(self.index(key))
+
+    def __iter__(self):
+        for index in range(self.count):
+            if self.counts[index]:
+                yield from list(self.shard(index))
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def clear(self):
+        self.shards.clear()
+        self.dirty.clear()
+        self.counts = [0] * self.count
+        for index in range(self.count):
+            if self.path(index).exists():
+                os.remove(self.path(index))
+        self.write_manifest()
+
+
+NO_KEYS = ((), (), None)
+
+
+def record_keys(record) -> tuple:
+    """
+    Phone keys, email keys and the birthday's month * 32 + day of a record.
+    """
+    bd = record.birthday.date if record.birthday else None
+    return (record.phone_keys,
+            tuple(normalize_email(email) for email in record.emails),
+            bd.month * 32 + bd.day if bd else None)
+
+
+class ShardedRecords(MutableMapping):
+    """
+    Records kept in a ShardStore as (record, keys it was indexed under). Records handed out
+    are remembered in a small LRU so edits survive their shard being dropped meanwhile.
+    """
+
+    def __init__(self, store, cache_size=1024):
+        self.store = store
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+    def keys_of(self, name) -> tuple:
+        entry = self.store.get(name)
+        return entry[1] if entry else NO_KEYS
+
+    def __getitem__(self, name):
+        if name in self.cache:
+            self.cache.move_to_end(name)
+            return self.cache[name]
+        record = self.store[name][0]
+        self.cache[name] = record
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return record
+
+    def __setitem__(self, name, record):
+        self.cache.pop(name, None)
+        self.store[name] = (record, self.keys_of(name))
+
+    def __delitem__(self, name):
+        self.cache.pop(name, None)
+        del self.store[name]
+
+    def __contains__(self, name):
+        return name in self.cache or name in self.store
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def clear(self):
+        self.cache.clear()
+        self.store.clear()
+
+
+class ShardedAddressBook(AddressBook):
+    """
+    AddressBook spread over hash-partitioned shard files for books larger than memory.
+    Records, phone and email owners and birthday buckets each live in their own ShardStore,
+    so memory and the cost of a commit follow the shards a command touches.
+    Writes to the stores are bracketed by a 'committing' flag in the records manifest; a store
+    found with the flag still set was cut off mid-write and gets its owner stores rebuilt on open.
+    """
+    concurrent_reads = False
+
+    def __init__(self, directory=None):
+        super().__init__()
+        self.indexes = []
+        self.directory = directory
+        self.phones = self.emails = self.birthdays = None
+
+    def stores(self) -> list:
+        return [self.data.store, self.phones, self.emails, self.birthdays]
+
+    def open(self, journaled=True, write_behind=None):
+        directory = Path(self.directory or SHARDS_DIR)
+        self.data = ShardedRecords(ShardStore(Path(directory, 'records')))
+        self.phones = ShardStore(Path(directory, 'phones'))
+        self.emails = ShardStore(Path(directory, 'emails'))
+        self.birthdays = ShardStore(Path(directory, 'birthdays'))
+        if not os.path.exists(directory) and os.path.exists(PHONEBOOK_FILE):
+            for record in Journal.read_book(JOURNAL_FILE, PHONEBOOK_FILE).values():
+                self.add_record(record)
+            self.commit()
+        if self.data.store.meta.get('committing') or self.phones.meta.get('phone_keys') != PHONE_KEYS_VERSION:
+            self.rebuild()
+
+    def rebuild(self):
+        """
+        Recounts the record shards and rebuilds the phone, email and birthday stores from the records,
+        after a commit that was cut short or for a store written by an older version.
+        """
+        records = self.data.store
+        records.recount()
+        with self.committing():
+            self.phones.meta['phone_keys'] = PHONE_KEYS_VERSION
+            for store in self.stores()[1:]:
+                store.clear()
+            for name in records:
+                record = records[name][0]
+                keys = record_keys(record)
+                records[name] = (record, keys)
+                self.update_keys(name, NO_KEYS, keys)
+            self.flush()
+
+    @contextmanager
+    def committing(self):
+        # The flag is left set when the writes fail half way, so the next open rebuilds.
+        records = self.data.store
+        records.meta['committing'] = True
+        records.write_manifest()
+        yield
+        del records.meta['committing']
+        records.write_manifest()
+
+    def flush(self):
+        for store in self.stores():
+            store.flush()
+
+    def commit(self):
+        if any(store.dirty for store in self.stores()):
+            with self.committing():
+                self.flush()
+
+    def save(self):
+        self.commit()
+
+    def close(self):
+        self.commit()
+
+    def load(self, data):
+        self.clear()
+        for record in data.values():
+            self.add_record(record)
+
+    @bloom_checked('tel:', phone_key)
+    def phone_owner(self, phone):
+        return self.phones.get(phone_key(phone))
+
+    @bloom_checked('mail:', normalize_email)
+    def email_owner(self, email):
+        return self.emails.get(normalize_email(email))
+
+    def search(self, query) -> list:
+        pattern = compile_search(query)
+        return sorted(name for name in self.data
+                      if any(pattern.search(term) for term in search_terms(self.data.store[name][0])))
+
+    def upcoming_birthdays(self, days, today=None) -> list:
+        result = []
+        for offset, (month, day) in birthday_window(today or datetime.now().date(), days):
+            result.extend((name, offset) for name in sorted(self.birthdays.get(month * 32 + day, ())))
+        return result
+
+    def names_between(self, first=None, last=None, after=None):
+        stop = None if last is None else last + '\U0010ffff'
+        runs = (sorted(name for name in names if (first is None or name >= first)
+                       and (stop is None or name < stop) and (after is None or name > after))
+                for names in self.data.store.shard_keys())
+        return heapq.merge(*runs)
+
+    def update_keys(self, name, old, new):
+        for owners, old_keys, new_keys in ((self.phones, old[0], new[0]), (self.emails, old[1], new[1])):
+            for key in set(old_keys) - set(new_keys):
+                if owners.get(key) == name:
+                    del owners[key]
+            for key in new_keys:
+                if owners.get(key) != name:
+                    owners[key] = name
+        if old[2] != new[2]:
+            if old[2] is not None:
+                names = self.birthdays[old[2]]
+                names.discard(name)
+                if names:
+                    self.birthdays[old[2]] = names
+                else:
+                    del self.birthdays[old[2]]
+            if new[2] is not None:
+                names = self.birthdays.get(new[2], set())
+                names.add(name)
+                self.birthdays[new[2]] = names
+        if self.fuzzy_index is not None:
+            if new is NO_KEYS:
+                self.fuzzy_index.discard(name)
+            else:
+                self.fuzzy_index.add(name, None)
+
+    def record_changed(self, name):
+        record = self.data.get(name)
+        if record is not None:
+            old, new = self.data.keys_of(name), record_keys(record)
+            self.data.store[name] = (record, new)
+            self.update_keys(name, old, new)
+            self.bloom_add(record)
+
+    def __setitem__(self, key, item):
+        self.data[key] = item
+        self.record_changed(key)
+
+    def __delitem__(self, key):
+        old = self.data.keys_of(key)
+        del self.data[key]
+        self.update_keys(key, old, NO_KEYS)
+
+    def clear(self):
+        with self.committing():
+            for store in self.stores():
+                store.clear()
+        self.data.cache.clear()
+        self.fuzzy_index = None
+        if self.bloom is not None:
+            self.build_bloom(self.bloom.error_rate)
+
+
+class BackgroundSaver:
+    """
+    Write-behind saving: changes only mark the book dirty, and a background thread writes
+    the snapshot once no change has arrived for delay seconds.
+    Commands run while holding lock, so the snapshot is always taken between two commands.
+    """
+
+    def __init__(self, book, path, delay=2.0):
+        self.book = book
+        self.path = Path(path)
+        self.delay = delay
+        self.lock = threading.RLock()
+        self.pending = False
+        self.last_change = 0.0
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='phonebook-saver', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def mark_dirty(self):
+        self.pending = True
+        self.last_change = time.monotonic()
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            if self.stopping.is_set():
+                return
+            idle = time.monotonic() - self.last_change
+            if idle < self.delay:
+                self.stopping.wait(self.delay - idle)
+                continue
+            self.wakeup.clear()
+            self.save()
+
+    def save(self):
+        with self.lock:
+            if not self.pending:
+                return
+            self.pending = False
+            payload = pickle.dumps(self.book.data)
+        tmp_path = Path(f'{self.path}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        self.thread.join()
+        self.save()
+
+
+class CommandStats:
+    """
+    Opt-in per-command measurements: wall time, CPU time, memory allocated (tracemalloc) and record count.
+    The collected stats are dumped as JSON to dump_path every dump_interval seconds.
+    """
+    histogram_bounds_ms = (0.1, 1, 10, 100, 1000)
+
+    def __init__(self, dump_path=None, dump_interval=60):
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.last_dump = time.monotonic()
+        self.commands = {}
+        tracemalloc.start()
+
+    def entry(self, name) -> dict:
+        if name not in self.commands:
+            self.commands[name] = {'calls': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0, 'allocated_kb': 0.0,
+                                   'records': 0, 'histogram': [0] * (len(self.histogram_bounds_ms) + 1)}
+        return self.commands[name]
+
+    @contextmanager
+    def measure(self, name):
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall_ms = (time.perf_counter() - wall) * 1000
+            cpu_ms = (time.process_time() - cpu) * 1000
+            entry = self.entry(name)
+            entry['calls'] += 1
+            entry['wall_ms'] += wall_ms
+            entry['cpu_ms'] += cpu_ms
+            entry['allocated_kb'] += (tracemalloc.get_traced_memory()[1] - memory_before) / 1024
+            entry['records'] = len(address_book)
+            entry['histogram'][sum(wall_ms > bound for bound in self.histogram_bounds_ms)] += 1
+            if self.dump_path and time.monotonic() - self.last_dump >= self.dump_interval:
+                self.dump()
+
+    def dump(self):
+        self.last_dump = time.monotonic()
+        with open(self.dump_path, 'w', encoding='utf-8') as f:
+            json.dump({'histogram_bounds_ms': self.histogram_bounds_ms, 'commands': self.commands},
+                      f, indent=2, ensure_ascii=False)
+
+    def report(self) -> list:
+        labels = [f'<={bound}' for bound in self.histogram_bounds_ms] + [f'>{self.histogram_bounds_ms[-1]}']
+        lines = []
+        for name, entry in sorted(self.commands.items(), key=lambda item: -item[1]['wall_ms']):
+            calls = entry['calls']
+            histogram = ' '.join(f'{label}:{count}' for label, count in zip(labels, entry['histogram']) if count)
+            lines.append(f'{name:<16} {calls:>7} {entry["wall_ms"] / calls:>10.3f} {entry["cpu_ms"] / calls:>10.3f} '
+                         f'{entry["allocated_kb"] / calls:>10.1f} {entry["records"]:>9}  {histogram}')
+        return lines
+
+
+def instrumented(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if command_stats is None:
+                return function(*args, **kwargs)
+            with command_stats.measure(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@instrumented('upload_check')
+def upload_check(journaled=True, write_behind=None):
+    if not os.path.exists(DATABASE_DIR):
+        os.makedirs(DATABASE_DIR)
+    address_book.open(journaled, write_behind)
+    if bloom_error_rate is not None:
+        address_book.build_bloom(bloom_error_rate)
+
+
+@instrumented('save_phonebook')
+def save_phonebook():
+    address_book.save()
+
+
+@instrumented('commit')
+def commit_phonebook():
+    address_book.commit()
+
+
+def choose_storage(name):
+    global address_book
+    if name == 'sqlite':
+        address_book = SQLiteAddressBook()
+    elif name == 'mapped':
+        address_book = MappedAddressBook()
+    elif name == 'sharded':
+        address_book = ShardedAddressBook()
     else:
-        time.sleep(0.5)
+        address_book = AddressBook()
+
+
+...
+
+
+class CommandTrie:
+    """
+    Token trie over the command aliases, built once from main_commands.
+    match() returns the function of the longest alias the command starts with and the remaining tokens.
+    """
+
+    def __init__(self, commands):
+        self.root = {}
+        for func, aliases in commands.items():
+            for alias in aliases:
+                node = self.root
+                for token in alias.split():
+                    node = node.setdefault(token, {})
+                node[None] = func
+
+    def match(self, command):
+        tokens = command.split()
+        node, func, depth = self.root, None, 0
+        for position, token in enumerate(tokens, 1):
+            node = node.get(token)
+            if node is None:
+                break
+            if None in node:
+                func, depth = node[None], position
+        return func, tokens[:depth], tokens[depth:]
+
+
+def command_parser(command: str):
+    """
+    Runs a command and returns what its handler returned: False when it failed, True when a MainFunctions
+    command succeeded, None for the SubFunctions ones.
+    """
+    func, alias, arguments = command_trie.match(command)
+    if func is None:
+        pause(0.5)
         SubFunctions.command_unknown()
+        return False
+    if command_stats is None:
+        return func(arguments)
+    with command_stats.measure(' '.join(alias)):
+        return func(arguments)
 
 
 main_commands = {
@@ -999,7 +3654,10 @@ main_commands = {
     MainFunctions.show_all: ['show all'],
     MainFunctions.near_bd: ['show near bd'],
     MainFunctions.search_command: ['find', 'search'],
+    MainFunctions.fuzzy_search: ['find~', 'search~'],
+    MainFunctions.import_contacts: ['import'],
     SubFunctions.help_command: ['help', 'помощь'],
+    SubFunctions.stats: ['stats'],
     SubFunctions.goodbye: ['exit', 'выход', 'quit', 'q'],
     SubFunctions.greetings: ['здравствуйте', 'привет', 'hello', 'hi'],
     SubFunctions.clear_screen: ['clear', 'cls'],
@@ -1007,19 +3665,82 @@ main_commands = {
     SubFunctions.top_secret: ['fuck you'],
 }
 
+command_trie = CommandTrie(main_commands)
+
+# commands that cannot be rolled back or that end the session, refused inside a batch
+batch_excluded = {MainFunctions.clear_phonebook, MainFunctions.import_contacts, SubFunctions.goodbye}
+# commands whose argument is free text: a ";" in it belongs to the argument, not to the batch
+free_text_commands = {MainFunctions.search_command, MainFunctions.fuzzy_search, MainFunctions.import_contacts}
+
+
+def days_argument(days) -> int:
+    try:
+        return int(days)
+    except (TypeError, ValueError):
+        raise NotANumberForCountOFRecords
+
+
+batch_arguments = {
+    MainFunctions.add_contact: (Name, Phone),
+    MainFunctions.update_number: (Name, Phone, Phone),
+    MainFunctions.append_number: (Name, Phone),
+    MainFunctions.delete_phone_number: (Name, Phone),
+    MainFunctions.delete_contact: (Name,),
+    MainFunctions.add_email: (Name, EMail),
+    MainFunctions.update_email: (Name, EMail, EMail),
+    MainFunctions.append_email: (Name, EMail),
+    MainFunctions.delete_email: (Name, EMail),
+    MainFunctions.add_birthday: (Name, Birthday),
+    MainFunctions.near_bd: (days_argument,),
+    MainFunctions.search_command: (str,),
+    MainFunctions.fuzzy_search: (str,),
+}
+
+
+@exception_handler
+def check_arguments(func, arguments):
+    """
+    Parses the arguments of a batched command with the field types its handler will use, without running it.
+    """
+    parsers = batch_arguments.get(func, ())
+    if len(arguments) < len(parsers):
+        raise NotEnoughArguments
+    for parse, argument in zip(parsers, arguments):
+        parse(argument)
+    return True
+
 lang = 'eng'
+interactive = True
+command_stats = None
 english_obj = EnglishLang()
 ukranian_obj = UkrainianLang()
+LOCALES_DIR = Path(__file__).with_name('locales')
 
 
-def lang_obj():
-    global lang
-    if lang == 'eng':
+def available_locales() -> list:
+    return ['eng', 'ukr', *sorted(path.stem for path in LOCALES_DIR.glob('*.json') if path.stem not in ('eng', 'ukr'))]
+
+
+@lru_cache(maxsize=None)
+def load_locale(code) -> PhonebookInterface:
+    """
+    Built-in languages, or locales/<code>.json loaded on first use; keys it lacks fall back to English.
+    """
+    if code == 'eng':
         return english_obj
-    elif lang == 'ukr':
+    elif code == 'ukr':
         return ukranian_obj
-    else:
+    try:
+        with open(Path(LOCALES_DIR, f'{code}.json'), encoding='utf-8') as f:
+            catalog = json.load(f)
+    except (FileNotFoundError, ValueError):
         return english_obj
+    return CatalogLang({section: {**templates, **catalog.get(section, {})}
+                        for section, templates in EnglishLang.commands_dict.items()})
+
+
+def lang_obj():
+    return load_locale(lang)
 
 
 def choose_lang():
@@ -1036,17 +3757,417 @@ def choose_lang():
             lang_obj().return_error('lang_not_chosen', True)
 
 
+class CommandBatcher:
+    """
+    Groups input lines into batches: a line of ";"-separated commands or a begin ... commit block
+    ("rollback" drops the block). Any other line is a batch of one command.
+    feed() returns the commands to run, or None while a block is still open.
+    """
+
+    def __init__(self):
+        self.block = None
+
+    @staticmethod
+    def split(line) -> list:
+        """
+        A ";" only starts a new command when a known command follows it; find, search and import take
+        the rest of the line as their argument, so they can only come last.
+        """
+        if ';' not in line:
+            return [line]
+        commands = []
+        for part in line.split(';'):
+            free_text = bool(commands) and command_trie.match(commands[-1])[0] in free_text_commands
+            if not free_text and not part.strip():
+                continue
+            if commands and (free_text or command_trie.match(part)[0] is None):
+                commands[-1] += ';' + part
+            else:
+                commands.append(part)
+        return [command.strip() for command in commands]
+
+    def feed(self, line):
+        line = line.strip()
+        if self.block is None:
+            if line == 'begin':
+                self.block = []
+                return None
+            return self.split(line)
+        if line == 'commit':
+            commands, self.block = self.block, None
+            return commands
+        if line == 'rollback':
+            self.block = None
+            lang_obj().return_message('batch_discarded', True)
+            return None
+        self.block.extend(self.split(line))
+        return None
+
+
+def run_commands(commands) -> None:
+    """
+    Runs a single command as is and several as one transaction: nothing runs unless every command
+    is known, allowed in a batch and has arguments that parse, and the first command whose handler
+    returns False rolls the changes of the batch back.
+    """
+    if len(commands) == 1:
+        command_parser(commands[0])
+        return
+    for command in commands:
+        func, _, arguments = command_trie.match(command)
+        if func is None or func in batch_excluded:
+            lang_obj().return_error('batch_rejected', True, command)
+            return
+        if not check_arguments(func, arguments):
+            lang_obj().return_error('batch_invalid', True, command)
+            return
+    address_book.begin()
+    try:
+        for command in commands:
+            if command_parser(command) is False:
+                address_book.rollback()
+                lang_obj().return_message('batch_rolled_back', True, command)
+                return
+    except BaseException:
+        address_book.rollback()
+        raise
+    address_book.end()
+    lang_obj().return_message('batch_applied', True, str(len(commands)))
+
+
+def run_batch(lines):
+    """
+    Runs commands without prompts or pauses and saves the phonebook once at the end.
+    """
+    batcher = CommandBatcher()
+    try:
+        for line in lines:
+            command = line.strip()
+            if not command or command.startswith('#'):
+                continue
+            commands = batcher.feed(command)
+            if commands:
+                run_commands(commands)
+            if commands == [command] and command in ['exit', 'выход', 'quit', 'q']:
+                break
+    finally:
+        save_phonebook()
+        address_book.close()
+
+
+def record_to_dict(record) -> dict:
+    return {
+        'name': record.name.value,
+        'phones': list(record.phones),
+        'emails': list(record.emails),
+        'birthday': record.birthday.value if record.birthday else None,
+    }
+
+
+def result_to_json(result):
+    if isinstance(result, Record):
+        return record_to_dict(result)
+    elif isinstance(result, BirthdayMatch):
+        return {'contact': record_to_dict(result.record), 'days': result.days}
+    elif isinstance(result, list):
+        return [result_to_json(item) for item in result]
+    elif isinstance(result, dict):
+        return {key: result_to_json(value) for key, value in result.items()}
+    return result
+
+
+def import_summary(rows) -> dict:
+    imported, rejected = 0, []
+    for position, error in rows:
+        if error:
+            rejected.append([position, error])
+        else:
+            imported += 1
+    return {'imported': imported, 'rejected': rejected}
+
+
+class ReadWriteLock:
+    """
+    Lets any number of readers or a single writer in; a waiting writer holds back new readers.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writers_waiting = 0
+        self.writing = False
+
+    @contextmanager
+    def read(self):
+        with self.condition:
+            while self.writing or self.writers_waiting:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.condition:
+            self.writers_waiting += 1
+            while self.writing or self.readers:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+
+
+class PhonebookServer:
+    """
+    Hosts address_book for many clients: newline-delimited JSON requests over TCP.
+    Requests look like {"id": 1, "op": "add_contact", "args": ["Bob", "0501234567"]}
+    or {"id": 2, "command": "show near bd 7"}; every response carries the request id
+    and either a JSON result or the name of the phonebook exception that was raised.
+    Mutations are queued to a single writer that applies them in arrival order and commits
+    once per drained batch. Reads run in worker threads, several at a time when the book
+    allows concurrent reads, and never on the event loop. A client may pipeline requests:
+    a read sent while its earlier writes are pending is queued behind them, and responses
+    come back in request order.
+    """
+    pipeline_depth = 1024
+    write_ops = {
+        'add_contact': engine.add_contact,
+        'update_number': engine.update_number,
+        'append_number': engine.append_number,
+        'delete_number': engine.delete_number,
+        'delete_contact': engine.delete_contact,
+        'add_email': engine.add_email,
+        'update_email': engine.update_email,
+        'append_email': engine.append_email,
+        'delete_email': engine.delete_email,
+        'add_birthday': engine.add_birthday,
+        'import': lambda path: import_summary(engine.import_contacts(path)),
+        'clear': engine.clear,
+    }
+    read_ops = {
+        'get': engine.contact,
+        'find': engine.search,
+        'near_bd': lambda days: engine.upcoming_birthdays(days_argument(days)),
+        'birthday_report': lambda *windows: {
+            str(days): matches for days, matches in engine.birthday_report(list(map(days_argument, windows))).items()},
+        'phone_owner': engine.phone_owner,
+        'email_owner': engine.email_owner,
+        'count': engine.count,
+    }
+
+    def __init__(self, host='127.0.0.1', port=8765):
+        self.host = host
+        self.port = port
+        self.writes = None
+        self.lock = ReadWriteLock()
+        self.pool = None
+
+    async def serve(self, ready=None):
+        self.writes = asyncio.Queue()
+        self.pool = ThreadPoolExecutor(thread_name_prefix='phonebook')
+        writer_task = asyncio.create_task(self.writer())
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        if ready:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer_task.cancel()
+            self.pool.shutdown(wait=True)
+
+    async def handle(self, reader, stream):
+        loop = asyncio.get_running_loop()
+        responses = asyncio.Queue(self.pipeline_depth)
+        sender = asyncio.create_task(self.send(stream, responses))
+        last_write = None
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict):
+                    response = loop.create_future()
+                    response.set_result({'id': None, 'ok': False, 'error': 'bad_json'})
+                elif ('command' in request or request.get('op') in self.write_ops
+                      or last_write is not None and not last_write.done()):
+                    response = last_write = loop.create_future()
+                    self.writes.put_nowait((request, response))
+                else:
+                    response = asyncio.ensure_future(self.read(request))
+                await responses.put(response)
+            await responses.put(None)
+            await sender
+        finally:
+            sender.cancel()
+            stream.close()
+
+    async def send(self, stream, responses):
+        while (response := await responses.get()) is not None:
+            self.reply(stream, await response)
+            await stream.drain()
+
+    @staticmethod
+    def reply(stream, response):
+        stream.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    async def read(self, request) -> dict:
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self.locked_read, request)
+
+    def locked_read(self, request) -> dict:
+        with self.lock.read() if address_book.concurrent_reads else self.lock.write():
+            return self.execute(request)
+
+    async def writer(self):
+        while True:
+            batch = [await self.writes.get()]
+            while not self.writes.empty():
+                batch.append(self.writes.get_nowait())
+            try:
+                responses = await asyncio.get_running_loop().run_in_executor(self.pool, self.apply, batch)
+            except Exception as error:
+                # The commit failed: the whole batch hears about it and the writer goes on with the next one.
+                responses = [{'id': request.get('id'), 'ok': False, 'error': type(error).__name__}
+                             for request, _ in batch]
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+
+    def apply(self, batch) -> list:
+        with self.lock.write():
+            responses = [self.execute(request) for request, _ in batch]
+            commit_phonebook()
+        return responses
+
+    @staticmethod
+    def call(op, args):
+        if not isinstance(args, list):
+            raise NotEnoughArguments
+        try:
+            inspect.signature(op).bind(*args)
+        except TypeError:
+            raise NotEnoughArguments
+        return op(*args)
+
+    def execute(self, request) -> dict:
+        response = {'id': request.get('id')}
+        try:
+            if 'command' in request:
+                with redirect_stdout(io.StringIO()) as output:
+                    command_parser(str(request['command']).strip())
+                response.update(ok=True, output=output.getvalue())
+            elif request.get('op') in self.write_ops:
+                result = self.call(self.write_ops[request['op']], request.get('args', []))
+                response.update(ok=True, result=result_to_json(result))
+            elif request.get('op') in self.read_ops:
+                result = self.call(self.read_ops[request['op']], request.get('args', []))
+                response.update(ok=True, result=result_to_json(result))
+            else:
+                response.update(ok=False, error='unknown_op')
+        except ContactNotFound as error:
+            response.update(ok=False, error=type(error).__name__, suggestions=error.suggestions)
+        except Exception as error:
+            response.update(ok=False, error=type(error).__name__)
+        return response
+
+
+def run_server(address):
+    host, _, port = address.rpartition(':')
+    server = PhonebookServer(host or '127.0.0.1', int(port))
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        address_book.close()
+
+
 def main():
-    choose_lang()
+    global lang, interactive, command_stats, search_workers, bloom_error_rate, phone_country
+    parser = argparse.ArgumentParser(description='PyBakers phonebook.')
+    parser.add_argument('--storage', choices=['pickle', 'sqlite', 'mapped', 'sharded'], default='pickle',
+                        help='where the phonebook is kept (default: pickle snapshot with a journal; '
+                             'mapped: binary snapshot read lazily through mmap; '
+                             'sharded: hash-partitioned shard files loaded on demand)')
+    parser.add_argument('--batch', metavar='FILE',
+                        help='run commands from FILE ("-" for stdin) without prompts and save once at the end')
+    parser.add_argument('--lang', choices=available_locales(),
+                        help='interface language, asked interactively when not given; '
+                             'more languages can be added as locales/<code>.json')
+    parser.add_argument('--write-behind', metavar='SECONDS', type=float, nargs='?', const=2.0,
+                        help='save in a background thread once the book has been idle for SECONDS (default: 2); '
+                             'pickle storage only, the other storages ignore it')
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help='share one phonebook with many clients as JSON lines over TCP')
+    parser.add_argument('--search-workers', metavar='N', type=int, nargs='?', const=os.cpu_count(), default=0,
+                        help='scan books of %d+ contacts with N processes for searches the index cannot narrow '
+                             '(default: all cores)' % PARALLEL_SEARCH_MIN)
+    parser.add_argument('--country', choices=sorted(PHONE_COUNTRIES), default='UA',
+                        help='country code and trunk prefix added to numbers entered without one (default: UA)')
+    parser.add_argument('--bloom', metavar='RATE', type=float, nargs='?', const=0.01,
+                        help='check new phones and emails against a Bloom filter with this false positive '
+                             'rate before looking them up (default: 0.01)')
+    parser.add_argument('--profile', action='store_true',
+                        help='measure every command; see them with "stats"')
+    parser.add_argument('--profile-dump', metavar='FILE',
+                        help='with --profile, write the measurements to FILE every --profile-interval seconds')
+    parser.add_argument('--profile-interval', type=float, default=60)
+    options = parser.parse_args()
+    choose_storage(options.storage)
+    phone_country = PHONE_COUNTRIES[options.country]
+    search_workers = options.search_workers
+    bloom_error_rate = options.bloom
+    if options.profile:
+        command_stats = CommandStats(options.profile_dump, options.profile_interval)
+    if options.serve:
+        interactive = False
+        lang = options.lang or 'eng'
+        upload_check()
+        run_server(options.serve)
+        return
+    if options.batch:
+        interactive = False
+        lang = options.lang or 'eng'
+        upload_check(journaled=False)
+        if options.batch == '-':
+            run_batch(sys.stdin)
+        else:
+            with open(options.batch, encoding='utf-8') as f:
+                run_batch(f)
+        if command_stats and command_stats.dump_path:
+            command_stats.dump()
+        return
+    if options.lang:
+        lang = options.lang
+    else:
+        choose_lang()
     SubFunctions.hello()
-    upload_check()
+    upload_check(write_behind=options.write_behind)
+    batcher = CommandBatcher()
     while True:
-        command = input(lang_obj().return_message('greeting_string', False))
-        command_parser(command.strip())
-        if command in ['exit', 'выход', 'quit', 'q']:
-            save_phonebook()
+        prompt = 'greeting_string' if batcher.block is None else 'batch_prompt'
+        command = input(lang_obj().return_message(prompt, False))
+        commands = batcher.feed(command)
+        if commands is None:
+            continue
+        with address_book.locked():
+            run_commands(commands)
+            commit_phonebook()
+        if commands == [command.strip()] and command in ['exit', 'выход', 'quit', 'q']:
+            address_book.close()
+            if command_stats and command_stats.dump_path:
+                command_stats.dump()
             break
-        save_phonebook()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,209 @@
+"""
+Benchmarks for the phonebook hot paths on synthetic books.
+
+    python benchmark.py --sizes 10000 100000 --output results.json
+
+Every phase reports throughput and latency percentiles; results are emitted as JSON
+so runs of different versions can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from pathlib import Path
+
+import average_phonebook as ap
+
+LATIN_STEMS = ('Anna', 'Oleg', 'Maria', 'Taras', 'Ivan', 'Olena', 'John', 'Sophia', 'Dmytro', 'Kateryna')
+CYRILLIC_STEMS = ('Анна', 'Олег', 'Олена', 'Тарас', 'Богдан', 'Оксана', 'Андрей', 'Наталья', 'Максим', 'Юлия')
+LATIN_LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+CYRILLIC_LETTERS = 'абвгдежзийклмнопрстуфхцчшщьюя'
+
+
+def encode(number, letters) -> str:
+    suffix = ''
+    while True:
+        number, rest = divmod(number, len(letters))
+        suffix += letters[rest]
+        if not number:
+            return suffix
+
+
+def synthetic_contacts(count, start=0, seed=0):
+    """
+    Yields (name, phone, email, birthday) tuples; names are unique, half Latin and half Cyrillic.
+    """
+    rnd = random.Random(seed + start)
+    first_birthday = date(1950, 1, 1)
+    for index in range(start, start + count):
+        if index % 2:
+            stem, letters = rnd.choice(CYRILLIC_STEMS), CYRILLIC_LETTERS
+        else:
+            stem, letters = rnd.choice(LATIN_STEMS), LATIN_LETTERS
+        name = stem + encode(index, letters)
+        phone = f'+380{index:09d}'
+        email = f'{rnd.choice(LATIN_STEMS).lower()}{index}@example.com'
+        birthday = (first_birthday + timedelta(days=rnd.randrange(20000))).strftime('%d.%m.%Y')
+        yield name, phone, email, birthday
+
+
+def summarize(latencies) -> dict:
+    latencies = sorted(latencies)
+    total = sum(latencies)
+
+    def percentile(share):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * share))] * 1000
+
+    return {
+        'ops': len(latencies),
+        'total_s': round(total, 6),
+        'ops_per_s': round(len(latencies) / total, 1) if total else None,
+        'p50_ms': round(percentile(0.50), 4),
+        'p90_ms': round(percentile(0.90), 4),
+        'p99_ms': round(percentile(0.99), 4),
+        'max_ms': round(latencies[-1] * 1000, 4),
+    }
+
+
+def timed(func, calls, trace_memory=False) -> dict:
+    """
+    Runs func(*args) for every args in calls with output discarded.
+    """
+    latencies = []
+    if trace_memory:
+        tracemalloc.start()
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull):
+        for args in calls:
+            started = time.perf_counter()
+            func(*args)
+            latencies.append(time.perf_counter() - started)
+    result = summarize(latencies)
+    if trace_memory:
+        result['peak_memory_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+
+def use_database(directory):
+    ap.DATABASE_DIR = Path(directory)
+    ap.PHONEBOOK_FILE = Path(directory, 'data_with_contacts.bin')
+    ap.JOURNAL_FILE = Path(directory, 'data_with_contacts.journal')
+    ap.SQLITE_FILE = Path(directory, 'data_with_contacts.sqlite3')
+    ap.MAPPED_FILE = Path(directory, 'data_with_contacts.pbs')
+    ap.MAPPED_JOURNAL_FILE = Path(directory, 'data_with_contacts.pbs.journal')
+    ap.SHARDS_DIR = Path(directory, 'shards')
+
+
+def populate(size, seed):
+    for name, phone, email, birthday in synthetic_contacts(size, seed=seed):
+        record = ap.Record(ap.Name(name), ap.Phone(phone), ap.Birthday(birthday))
+        record.add_email(email)
+        ap.address_book.add_record(record)
+    ap.address_book.commit()
+
+
+def search_queries(size, count, seed) -> list:
+    rnd = random.Random(seed)
+    queries = []
+    for name, phone, email, _ in synthetic_contacts(count, start=rnd.randrange(max(size - count, 1)), seed=seed):
+        queries.append(([name[rnd.randrange(len(name) - 3):][:4]],))
+        queries.append(([phone[-7:]],))
+        queries.append(([email.split('@')[0][-5:]],))
+    queries.append((['^an.*a$'],))
+    return queries
+
+
+def page_through(page_size):
+    for _ in ap.address_book.iterator(page_size):
+        pass
+
+
+def run_size(size, options) -> dict:
+    phases = {}
+    with tempfile.TemporaryDirectory() as directory:
+        use_database(directory)
+        ap.choose_storage(options.storage)
+        ap.upload_check()
+        phases['populate'] = timed(populate, [(size, options.seed)], options.trace_memory)
+        phases['save_phonebook'] = timed(ap.save_phonebook, [()] * options.repeat, options.trace_memory)
+        ap.address_book.close()
+
+        ap.choose_storage(options.storage)
+        phases['upload_check'] = timed(ap.upload_check, [()], options.trace_memory)
+
+        fresh = synthetic_contacts(options.ops, start=size, seed=options.seed)
+        phases['add_contact'] = timed(ap.MainFunctions.add_contact,
+                                      [([name, phone],) for name, phone, _, _ in fresh], options.trace_memory)
+        ap.address_book.commit()
+        phases['search_command'] = timed(ap.MainFunctions.search_command,
+                                         search_queries(size, options.queries, options.seed), options.trace_memory)
+        phases['near_bd'] = timed(ap.MainFunctions.near_bd,
+                                  [([str(days)],) for days in (1, 7, 30, 365)] * options.repeat,
+                                  options.trace_memory)
+        phases['show_all_paging'] = timed(page_through, [(options.page_size,)], options.trace_memory)
+        phases['show_all_paging']['pages'] = -(-len(ap.address_book) // options.page_size)
+        ap.address_book.close()
+    return {'size': size, 'phases': phases}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the phonebook hot paths on synthetic books.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000],
+                        help='book sizes to benchmark, 10k to 10M contacts (default: 10000)')
+    parser.add_argument('--storage', choices=['pickle', 'sqlite', 'mapped', 'sharded'], default='pickle')
+    parser.add_argument('--ops', type=int, default=1000, help='add_contact calls per size')
+    parser.add_argument('--queries', type=int, default=100, help='search_command queries per kind')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions of save_phonebook and near_bd')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bloom', metavar='RATE', type=float,
+                        help='open the books with a Bloom filter of this false positive rate')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='report tracemalloc peaks per phase (slows every phase down)')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    options = parser.parse_args()
+
+    ap.interactive = False
+    ap.bloom_error_rate = options.bloom
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'storage': options.storage,
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': [run_size(size, options) for size in options.sizes],
+        'peak_rss_kb': peak_rss_kb(),
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if options.output:
+        Path(options.output).write_text(text + '\n', encoding='utf-8')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,714 @@
+import asyncio
+import json
+import pickle
+import random
+import tempfile
+import threading
+import unittest
+from datetime import date
+from pathlib import Path
+
+import average_phonebook as ap
+
+
+def contact(name, phone, birthday=None):
+    return ap.Record(ap.Name(name), ap.Phone(phone), ap.Birthday(birthday) if birthday else None)
+
+
+class BookTestCase(unittest.TestCase):
+    """
+    Points the phonebook files at a temporary directory for every test.
+    """
+    storage = 'pickle'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name)
+        names = {
+            'DATABASE_DIR': self.path,
+            'PHONEBOOK_FILE': self.path / 'data_with_contacts.bin',
+            'JOURNAL_FILE': self.path / 'data_with_contacts.journal',
+            'SQLITE_FILE': self.path / 'data_with_contacts.sqlite3',
+            'MAPPED_FILE': self.path / 'data_with_contacts.pbs',
+            'MAPPED_JOURNAL_FILE': self.path / 'data_with_contacts.pbs.journal',
+            'SHARDS_DIR': self.path / 'shards',
+        }
+        for name, value in names.items():
+            self.addCleanup(setattr, ap, name, getattr(ap, name))
+            setattr(ap, name, value)
+        self.addCleanup(setattr, ap, 'interactive', ap.interactive)
+        self.addCleanup(setattr, ap, 'address_book', ap.address_book)
+        ap.interactive = False
+        self.reopen()
+
+    def reopen(self):
+        if getattr(self, 'book', None) is not None:
+            self.book.close()
+        ap.choose_storage(self.storage)
+        ap.upload_check()
+        self.book = ap.address_book
+        self.addCleanup(self.book.close)
+
+
+@unittest.skipIf(ap.np is None, 'NumPy is not installed')
+class BirthdayColumnsTest(unittest.TestCase):
+
+    def test_deleted_slots_never_match(self):
+        columns = ap.BirthdayColumns()
+        columns.add('Anna', contact('Anna', '0501112233', '01.02.1990'))
+        columns.add('Oleg', contact('Oleg', '0501112234', '03.04.1990'))
+        columns.discard('Anna')
+        self.assertEqual(columns.upcoming(date(2024, 1, 1), 7), [])
+        for days in (366, 40000):
+            self.assertEqual([name for name, _ in columns.upcoming(date(2024, 1, 1), days)], ['Oleg'])
+
+    def test_matches_birthday_index(self):
+        columns, index = ap.BirthdayColumns(), ap.BirthdayIndex()
+        for number, birthday in enumerate(('28.02.1990', '29.02.1992', '01.03.1990', '31.12.1990')):
+            record = contact(f'Name{"abcd"[number]}', f'050111223{number}', birthday)
+            columns.add(record.name.value, record)
+            index.add(record.name.value, record)
+        for today in (date(2023, 2, 27), date(2024, 12, 30)):
+            self.assertEqual(columns.upcoming(today, 40000), index.upcoming(today, 40000))
+
+
+class BirthdayReportTest(BookTestCase):
+
+    def test_report_after_delete(self):
+        self.book.add_record(contact('Anna', '0501112233', '01.02.1990'))
+        self.book.add_record(contact('Oleg', '0501112234', '03.04.1990'))
+        ap.engine.delete_contact('Anna')
+        report = ap.engine.birthday_report([7, 40000])
+        self.assertEqual([match.record.name.value for match in report[40000]], ['Oleg'])
+
+
+class CommandTrieTest(unittest.TestCase):
+
+    def assert_match(self, command, func, alias, arguments):
+        self.assertEqual(ap.command_trie.match(command), (func, alias.split(), arguments))
+
+    def test_longest_alias_wins(self):
+        self.assert_match('clear', ap.SubFunctions.clear_screen, 'clear', [])
+        self.assert_match('clear phonebook y', ap.MainFunctions.clear_phonebook, 'clear phonebook', ['y'])
+        self.assert_match('clear the screen', ap.SubFunctions.clear_screen, 'clear', ['the', 'screen'])
+        self.assert_match('show near bd 7', ap.MainFunctions.near_bd, 'show near bd', ['7'])
+        self.assert_match('show all 5', ap.MainFunctions.show_all, 'show all', ['5'])
+
+    def test_tokens_match_whole(self):
+        self.assert_match('find~ Ana', ap.MainFunctions.fuzzy_search, 'find~', ['Ana'])
+        self.assert_match('find Ana', ap.MainFunctions.search_command, 'find', ['Ana'])
+        self.assert_match('  add   contact  Anna ', ap.MainFunctions.add_contact, 'add contact', ['Anna'])
+        self.assert_match('помощь', ap.SubFunctions.help_command, 'помощь', [])
+
+    def test_unknown_commands(self):
+        for command in ('', 'show', 'add', 'clearphonebook', 'finder Ana', 'thank'):
+            with self.subTest(command=command):
+                self.assertIsNone(ap.command_trie.match(command)[0])
+
+    def test_prefix_without_its_own_alias(self):
+        trie = ap.CommandTrie({'long': ['a b c'], 'short': ['a']})
+        self.assertEqual(trie.match('a b x'), ('short', ['a'], ['b', 'x']))
+        self.assertEqual(trie.match('a b c x'), ('long', ['a', 'b', 'c'], ['x']))
+
+
+class SortedNameIndexTest(unittest.TestCase):
+
+    class SmallBlocks(ap.SortedNameIndex):
+        BLOCK_SIZE = 4
+
+    def setUp(self):
+        self.index = self.SmallBlocks()
+        self.names = [f'{first}{second}' for first in 'ABCDEFGHIJ' for second in 'abcdefghijklmnopqrst']
+        random.Random(7).shuffle(self.names)
+        for name in self.names:
+            self.index.add(name, None)
+
+    def assert_consistent(self):
+        expected = sorted(self.index.names)
+        self.assertEqual([name for block in self.index.blocks for name in block], expected)
+        self.assertEqual(self.index.maxes, [block[-1] for block in self.index.blocks])
+        self.assertTrue(all(0 < len(block) <= 2 * self.index.BLOCK_SIZE for block in self.index.blocks))
+        for first, last, after in ((None, None, None), ('Cc', None, None), (None, 'D', None), ('B', 'E', None),
+                                   ('Bz', 'Ca', None), (None, None, 'Ej'), ('A', 'J', 'Ht'), ('Ja', None, None),
+                                   ('K', None, None), (None, 'A', 'Aa'), ('D', 'D', 'Dd')):
+            with self.subTest(first=first, last=last, after=after):
+                self.assertEqual(list(self.index.between(first, last, after)),
+                                 [name for name in expected
+                                  if (first is None or name >= first) and (after is None or name > after)
+                                  and (last is None or name[:len(last)] <= last)])
+
+    def test_splits_keep_the_order(self):
+        self.assertGreater(len(self.index.blocks), len(self.names) // (2 * self.index.BLOCK_SIZE))
+        self.assert_consistent()
+
+    def test_discards_after_splits(self):
+        for name in self.names[::3]:
+            self.index.discard(name)
+        self.index.discard('Zz')
+        self.assert_consistent()
+        for name in self.names[:len(self.names) // 2]:
+            self.index.discard(name)
+            self.index.add(name[::-1].title(), None)
+        self.assert_consistent()
+
+    def test_default_block_size(self):
+        self.index = ap.SortedNameIndex()
+        for name in sorted(self.names, key=lambda name: name[::-1]):
+            for third in 'abcdef':
+                self.index.add(name + third, None)
+        self.assertGreater(len(self.index.blocks), 1)
+        self.assert_consistent()
+
+
+class RecordTest(unittest.TestCase):
+
+    def test_pickle_round_trip(self):
+        record = contact('Anna', '0501234567')
+        record.add_email('anna@example.com')
+        copy = pickle.loads(pickle.dumps(record))
+        self.assertEqual((copy.phones, copy.emails, copy.phone_keys),
+                         (('0501234567',), ('anna@example.com',), (380501234567,)))
+
+    def test_legacy_state_is_compacted(self):
+        record = ap.Record.__new__(ap.Record)
+        record.__setstate__((ap.Name('Anna'), ['0501234567'], ['anna@example.com'], None))
+        self.assertEqual((record.phones, record.emails, record.phone_keys),
+                         (('0501234567',), ('anna@example.com',), (380501234567,)))
+        self.assertTrue(record.delete_email('anna@example.com'))
+        self.assertEqual(record.emails, ())
+
+
+class PhoneKeyTest(BookTestCase):
+
+    def test_spellings_share_one_key(self):
+        keys = {ap.phone_key(phone) for phone in ('+38(050)123-45-67', '380501234567', '0501234567', '00380501234567')}
+        self.assertEqual(keys, {380501234567})
+
+    def test_keys_follow_phones(self):
+        record = contact('Anna', '+38(050)123-45-67')
+        self.assertFalse(record.add_phone('0501234567'))
+        self.assertTrue(record.add_phone('0671112233'))
+        self.assertTrue(record.delete_phone('380501234567'))
+        self.assertEqual((list(record.phones), record.phone_keys), (['0671112233'], (380671112233,)))
+
+    def test_keys_survive_reopen_with_other_country(self):
+        self.book.add_record(contact('Anna', '0501234567'))
+        self.book.save()
+        self.addCleanup(setattr, ap, 'phone_country', ap.phone_country)
+        ap.phone_country = ap.PHONE_COUNTRIES['PL']
+        self.reopen()
+        self.assertEqual(self.book.phone_owner('+380501234567'), 'Anna')
+        self.assertIsNone(self.book.phone_owner('0501234567'))
+
+
+class SQLitePhoneKeyTest(PhoneKeyTest):
+    storage = 'sqlite'
+
+
+class MappedPhoneKeyTest(PhoneKeyTest):
+    storage = 'mapped'
+
+
+class ShardedPhoneKeyTest(PhoneKeyTest):
+    storage = 'sharded'
+
+
+def numbered_name(number):
+    return 'Name' + chr(ord('a') + number // 26) + chr(ord('a') + number % 26)
+
+
+class JournalTest(BookTestCase):
+
+    def add(self, numbers):
+        for number in numbers:
+            self.book.add_record(contact(numbered_name(number), f'050{number:07}'))
+            self.book.commit()
+
+    def test_changes_are_replayed(self):
+        self.add(range(3))
+        del self.book[numbered_name(1)]
+        self.book.commit()
+        self.reopen()
+        self.assertEqual(sorted(self.book), [numbered_name(0), numbered_name(2)])
+
+    def test_torn_tail_is_ignored(self):
+        self.add(range(2))
+        self.book.close()
+        with open(ap.JOURNAL_FILE, 'ab') as f:
+            f.write(ap.pickle.dumps(('put', 'Oleg', contact('Oleg', '0671112233')))[:-5])
+        self.reopen()
+        self.assertEqual(sorted(self.book), [numbered_name(0), numbered_name(1)])
+
+    def test_compaction(self):
+        self.book.journal.compact_size = 512
+        self.add(range(60))
+        self.book.close()
+        self.assertFalse(self.book.journal.old_path.exists())
+        self.assertGreater(len(ap.Journal.load_snapshot(ap.PHONEBOOK_FILE)), 0)
+        self.reopen()
+        self.assertEqual(len(self.book), 60)
+
+    def test_failed_fold_keeps_its_journal(self):
+        failures = []
+
+        def fail_once(path, data):
+            if not failures:
+                failures.append(path)
+                raise OSError('disk full')
+            ap.write_snapshot(path, data)
+
+        self.addCleanup(setattr, threading, 'excepthook', threading.excepthook)
+        threading.excepthook = lambda arguments: None
+        self.addCleanup(setattr, ap.Journal, 'dump_snapshot', ap.Journal.__dict__['dump_snapshot'])
+        ap.Journal.dump_snapshot = staticmethod(fail_once)
+        self.book.journal.compact_size = 512
+        self.add(range(60))
+        self.book.close()
+        self.assertEqual(len(failures), 1)
+        self.reopen()
+        self.assertEqual(len(self.book), 60)
+
+
+class BloomFilterTest(BookTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book.build_bloom(0.01)
+
+    def add(self, count):
+        for number in range(count):
+            name = 'Name' + ''.join(chr(ord('a') + number // 26 ** power % 26) for power in (2, 1, 0))
+            record = contact(name, f'050{number:07}')
+            record.add_email(f'{name}@example.com')
+            self.book.add_record(record)
+
+    def test_no_false_negatives_after_growing(self):
+        capacity = self.book.bloom.capacity
+        self.add(capacity)
+        self.assertGreater(self.book.bloom.capacity, capacity)
+        self.assertLessEqual(self.book.bloom.count, self.book.bloom.capacity)
+        for name, record in self.book.data.items():
+            self.assertEqual(self.book.phone_owner(record.phones[0]), name)
+            self.assertEqual(self.book.email_owner(record.emails[0]), name)
+        self.assertEqual((self.book.bloom.saved, self.book.bloom.false_positives), (0, 0))
+
+    def test_no_false_negatives_when_a_rebuild_grows(self):
+        self.book.bloom = None
+        self.add(1500)
+        self.book.build_bloom(0.01, capacity=1)
+        self.assertGreaterEqual(self.book.bloom.capacity, 2048)
+        for name, record in self.book.data.items():
+            self.assertEqual(self.book.phone_owner(record.phones[0]), name)
+            self.assertEqual(self.book.email_owner(record.emails[0]), name)
+
+    def test_counters(self):
+        self.add(3)
+        bloom = self.book.bloom
+        self.assertEqual(self.book.phone_owner('0500000001'), 'Nameaab')
+        self.assertIsNone(self.book.phone_owner('0679999999'))
+        self.assertEqual((bloom.checks, bloom.saved + bloom.false_positives), (2, 1))
+        bloom.bits[:] = b'\xff' * len(bloom.bits)
+        saved = bloom.saved
+        self.assertIsNone(self.book.email_owner('nobody@example.com'))
+        self.assertEqual((bloom.checks, bloom.saved, bloom.false_positives), (3, saved, 2 - saved))
+
+    def test_counters_survive_a_rebuild(self):
+        self.book.phone_owner('0679999999')
+        checks, saved = self.book.bloom.checks, self.book.bloom.saved
+        self.add(self.book.bloom.capacity)
+        self.assertEqual((self.book.bloom.checks, self.book.bloom.saved), (checks, saved))
+
+
+class PickleMigrationTest(BookTestCase):
+    """
+    Opens a pickle book, whose last contact is only in the journal, with another storage.
+    """
+    target = 'pickle'
+
+    def setUp(self):
+        super().setUp()
+        self.book.add_record(contact('Anna', '0501234567'))
+        self.book.save()
+        self.book.add_record(contact('Oleg', '0671112233'))
+        self.book.commit()
+        self.storage = self.target
+        self.reopen()
+
+    def test_pickle_book_is_imported(self):
+        self.assertEqual(sorted(self.book.data), ['Anna', 'Oleg'])
+        self.assertEqual(self.book.phone_owner('0671112233'), 'Oleg')
+
+    def test_emptied_book_stays_empty(self):
+        self.book.data.clear()
+        self.book.save()
+        self.reopen()
+        self.assertEqual(len(self.book.data), 0)
+
+
+class SQLiteMigrationTest(PickleMigrationTest):
+    target = 'sqlite'
+
+
+class ShardedMigrationTest(PickleMigrationTest):
+    target = 'sharded'
+
+
+def write_version_1_snapshot(path, name, phone, email):
+    """
+    A snapshot as written before phone keys: values hold only phones and emails and the key tables are empty.
+    """
+    pool = bytearray()
+
+    def put(text):
+        raw = text.encode('utf-8')
+        pool.extend(raw)
+        return len(pool) - len(raw), len(raw)
+
+    records = ap.SNAPSHOT_RECORD.pack(*put(name), *put(f'{phone}\x1e{email}'), 0)
+    offset = ap.SNAPSHOT_HEADER.size
+    offsets = [offset, *[offset + len(records)] * 4]
+    path.write_bytes(ap.SNAPSHOT_HEADER.pack(ap.SNAPSHOT_MAGIC, 1, 1, 0, 0, 0, *offsets) + records + pool)
+
+
+class MappedSnapshotTest(BookTestCase):
+    storage = 'mapped'
+
+    def readd(self):
+        for name, phone in (('Anna', '0501234567'), ('Oleg', '0671112233')):
+            self.book.add_record(contact(name, phone))
+        self.book.save()
+        del self.book['Anna']
+        self.book.add_record(contact('Anna', '0631112233'))
+
+    def assert_single_anna(self):
+        self.assertEqual(list(self.book.data), ['Anna', 'Oleg'])
+        self.assertEqual(len(self.book.data), 2)
+        self.assertEqual(list(self.book.names_between()), ['Anna', 'Oleg'])
+        self.assertEqual(self.book.phone_owner('0631112233'), 'Anna')
+
+    def test_deleted_name_added_again(self):
+        self.readd()
+        self.assert_single_anna()
+
+    def test_deleted_name_added_again_after_reopen(self):
+        self.readd()
+        self.book.save()
+        self.reopen()
+        self.assert_single_anna()
+        self.assertEqual(self.book.data.snapshot.count, 2)
+
+    def test_deleted_name_replayed_from_the_journal(self):
+        self.readd()
+        self.book.commit()
+        self.book.close()
+        self.book = None
+        self.reopen()
+        self.assert_single_anna()
+
+    def test_pickle_book_is_migrated(self):
+        self.book.close()
+        for path in (ap.MAPPED_FILE, ap.MAPPED_JOURNAL_FILE):
+            path.unlink()
+        self.storage = 'pickle'
+        self.reopen()
+        self.book.add_record(contact('Anna', '0501234567'))
+        self.book.save()
+        self.book.add_record(contact('Oleg', '0671112233'))
+        self.book.commit()
+        self.storage = 'mapped'
+        self.reopen()
+        self.assertEqual(list(self.book.data), ['Anna', 'Oleg'])
+        self.assertEqual(self.book.data.snapshot.count, 2)
+        self.assertEqual(self.book.phone_owner('0671112233'), 'Oleg')
+
+    def test_rolled_back_delete(self):
+        for name, phone in (('Anna', '0501234567'), ('Oleg', '0671112233')):
+            self.book.add_record(contact(name, phone))
+        self.book.save()
+        with ap.redirect_stdout(ap.io.StringIO()):
+            ap.run_commands(['delete contact Anna', 'delete contact Nobody'])
+        self.assertEqual(list(self.book.data), ['Anna', 'Oleg'])
+        self.assertEqual(len(self.book.data), 2)
+
+    def test_round_trip(self):
+        record = contact('Anna', '0501234567', '17.05.1990')
+        record.add_email('Anna@Example.com')
+        path = self.path / 'round_trip.pbs'
+        ap.write_mapped_snapshot(path, {'Anna': record, 'Oleg': contact('Oleg', '0671112233')})
+        snapshot = ap.MappedSnapshot(path)
+        self.addCleanup(snapshot.close)
+        self.assertEqual((snapshot.count, snapshot.version), (2, ap.SNAPSHOT_VERSION))
+        self.assertEqual(snapshot.phone_owner(ap.phone_key('0671112233')), 'Oleg')
+        self.assertEqual(snapshot.email_owner('anna@example.com'), 'Anna')
+        copy = snapshot.record(snapshot.position('Anna'))
+        self.assertEqual((copy.phones, copy.emails, copy.phone_keys, copy.birthday.date),
+                         (('0501234567',), ('Anna@Example.com',), (380501234567,), date(1990, 5, 17)))
+
+    def test_version_1_is_upgraded(self):
+        self.book.close()
+        write_version_1_snapshot(ap.MAPPED_FILE, 'Anna', '0501234567', 'anna@example.com')
+        self.reopen()
+        self.assertEqual(self.book.data.snapshot.version, ap.SNAPSHOT_VERSION)
+        self.assertEqual(self.book.phone_owner('+380501234567'), 'Anna')
+        self.assertEqual(self.book.email_owner('anna@example.com'), 'Anna')
+
+    def test_save_replaces_the_mapped_file(self):
+        for name, phone in (('Anna', '0501234567'), ('Oleg', '0671112233')):
+            self.book.add_record(contact(name, phone))
+            self.book.save()
+        self.assertEqual(self.book.phone_owner('0501234567'), 'Anna')
+        self.assertFalse(ap.MappedJournal.pending(ap.MAPPED_FILE).exists())
+        self.reopen()
+        self.assertEqual(sorted(self.book.data), ['Anna', 'Oleg'])
+
+    def test_background_fold_is_installed(self):
+        self.book.journal.compact_size = 512
+        for number in range(100):
+            self.book.add_record(contact('Name' + chr(ord('a') + number // 26) + chr(ord('a') + number % 26),
+                                         f'050{number:07}'))
+            self.book.commit()
+        self.book.close()
+        self.assertFalse(ap.MappedJournal.pending(ap.MAPPED_FILE).exists())
+        self.reopen()
+        self.assertEqual(len(self.book.data), 100)
+        self.assertEqual(self.book.phone_owner('0500000099'), 'Namedv')
+
+
+class ShardedTest(BookTestCase):
+    storage = 'sharded'
+
+    def setUp(self):
+        super().setUp()
+        self.names = ['Anna', 'Bohdan', 'Iryna', 'Oleg', 'Olena', 'Petro', 'Taras', 'Zoya']
+        for number, name in enumerate(self.names):
+            self.book.add_record(contact(name, f'050000000{number}'))
+        self.book.commit()
+
+    def test_names_between_merges_the_shards(self):
+        self.assertEqual(list(self.book.names_between()), self.names)
+        self.assertEqual(list(self.book.names_between('B', 'O')), ['Bohdan', 'Iryna', 'Oleg', 'Olena'])
+        self.assertEqual(list(self.book.names_between(after='Oleg')), ['Olena', 'Petro', 'Taras', 'Zoya'])
+
+    def test_interrupted_commit_is_rebuilt(self):
+        self.book.add_record(contact('Yurii', '0671112233'))
+
+        def crash():
+            raise OSError
+
+        self.book.phones.flush = crash
+        with self.assertRaises(OSError):
+            self.book.commit()
+        del self.book.phones.flush
+        self.book = None
+        self.reopen()
+        self.assertNotIn('committing', self.book.data.store.meta)
+        self.assertEqual(self.book.phone_owner('0671112233'), 'Yurii')
+        self.assertEqual(len(self.book.data), len(self.names) + 1)
+
+
+class TrigramIndexTest(BookTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for number, name in enumerate(['Anna', 'Annette', 'Joanna', 'Oleg', 'Olena', 'Олена', 'Hanna']):
+            record = contact(name, f'050{number:07}')
+            record.add_email(f'{name.lower()}{number}@example.com')
+            self.book.add_record(record)
+
+    def full_scan(self, query):
+        pattern = ap.compile_search(query)
+        return sorted(name for name, record in self.book.data.items()
+                      if any(pattern.search(term) for term in ap.search_terms(record)))
+
+    def assert_parity(self):
+        for query in ('ann', 'anna', 'nna$', '^ann', 'ole', 'оле', 'ena', 'a.n', 'a', 'xyz',
+                      '0500000003', '00002', 'example', 'anna0@', 'anna|oleg', 'h?anna'):
+            with self.subTest(query=query):
+                self.assertEqual(self.book.search(query), self.full_scan(query))
+
+    def test_same_results_as_a_full_scan(self):
+        self.assertEqual(self.book.search('anna'), ['Anna', 'Hanna', 'Joanna'])
+        self.assert_parity()
+
+    def test_same_results_after_changes(self):
+        ap.run_commands(['delete contact Joanna', 'add email Oleg anna.friend@example.com'])
+        self.assertEqual(self.book.search('anna'), ['Anna', 'Hanna', 'Oleg'])
+        self.assert_parity()
+
+
+class ParallelSearchTest(BookTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name, value in (('PARALLEL_SEARCH_MIN', 1), ('search_workers', 2)):
+            self.addCleanup(setattr, ap, name, getattr(ap, name))
+            setattr(ap, name, value)
+        self.addCleanup(ap.close_scan_pool)
+        for number in range(40):
+            self.book.add_record(contact('Name' + chr(ord('a') + number // 26) + chr(ord('a') + number % 26),
+                                         f'050{number:07}'))
+
+    def test_pool_is_reused_until_the_book_changes(self):
+        if threading.active_count() > 1:
+            self.skipTest('other threads are running')
+        self.assertEqual(self.book.search('^n.m.b'), [f'Nameb{chr(ord("a") + number)}' for number in range(14)])
+        pool = ap._scan_pool
+        self.assertIsNotNone(pool)
+        self.book.search('^n.m.a')
+        self.assertIs(ap._scan_pool, pool)
+        self.book.add_record(contact('Namezz', '0671112233'))
+        self.assertEqual(self.book.search('z.$'), ['Namezz'])
+        self.assertIsNot(ap._scan_pool, pool)
+
+    def test_no_fork_while_other_threads_run(self):
+        release = threading.Event()
+        thread = threading.Thread(target=release.wait)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        self.assertEqual(self.book.search('^n.m.aa'), ['Nameaa'])
+        if 'fork' in ap.multiprocessing.get_all_start_methods():
+            self.assertIsNone(ap._scan_pool)
+
+
+class ImportTest(BookTestCase):
+
+    def import_rows(self, name, content):
+        path = self.path / name
+        path.write_bytes(content)
+        return list(ap.engine.import_contacts(path))
+
+    def test_undecodable_rows_are_rejected(self):
+        rows = self.import_rows('contacts.csv', 'name,phone\nAnna,0501112233\n'.encode('utf-8')
+                                + 'Олег,0501112234\n'.encode('cp1251'))
+        self.assertEqual(rows, [(2, None), (3, 'undecodable_row')])
+        self.assertEqual(list(self.book), ['Anna'])
+
+    def test_unreadable_files(self):
+        (self.path / 'folder.csv').mkdir()
+        with self.assertRaises(ap.ImportFileUnreadable):
+            list(ap.engine.import_contacts(self.path / 'folder.csv'))
+        with self.assertRaises(ap.ImportFileUnreadable):
+            self.import_rows('huge.csv', b'name,phone\n"' + b'a' * (ap.csv.field_size_limit() + 1) + b'"\n')
+
+    def test_vcard_names_with_spaces(self):
+        rows = self.import_rows('contacts.vcf', b'BEGIN:VCARD\nFN:John Smith\nTEL:0501112233\nEND:VCARD\n'
+                                                b'BEGIN:VCARD\nN:Doe;Jane;;;\nTEL:0501112234\nEND:VCARD\n')
+        self.assertEqual(rows, [(1, None), (5, None)])
+        self.assertEqual(sorted(self.book), ['Janedoe', 'Johnsmith'])
+
+    def test_cli_reports_unreadable_file(self):
+        (self.path / 'folder.csv').mkdir()
+        with ap.redirect_stdout(ap.io.StringIO()) as output:
+            ap.command_parser(f'import {self.path / "folder.csv"}')
+        self.assertIn(ap.lang_obj().return_error('import_file_unreadable', False), output.getvalue())
+
+
+class BatchTest(BookTestCase):
+
+    def run_line(self, line):
+        with ap.redirect_stdout(ap.io.StringIO()) as output:
+            ap.run_commands(ap.CommandBatcher().feed(line))
+        return output.getvalue()
+
+    def test_split_keeps_free_text_arguments(self):
+        split = ap.CommandBatcher.split
+        self.assertEqual(split('add contact Anna 0501234567; delete contact Oleg'),
+                         ['add contact Anna 0501234567', 'delete contact Oleg'])
+        self.assertEqual(split('find a;b'), ['find a;b'])
+        self.assertEqual(split('add contact Anna 0501234567; find ^an;na; delete contact Oleg'),
+                         ['add contact Anna 0501234567', 'find ^an;na; delete contact Oleg'])
+        self.assertEqual(split('import /tmp/a;b.csv'), ['import /tmp/a;b.csv'])
+
+    def test_failing_command_rolls_back(self):
+        output = self.run_line('add contact Anna 0501234567; delete contact Oleg')
+        self.assertIn(ap.lang_obj().return_message('batch_rolled_back', False, 'delete contact Oleg'), output)
+        self.assertEqual(list(self.book), [])
+
+    def test_arguments_are_checked_before_running(self):
+        for line in ('add contact Anna 0501234567; show near bd', 'add contact Anna 0501234567; add birthday Anna x'):
+            output = self.run_line(line)
+            self.assertIn(ap.lang_obj().return_error('batch_invalid', False, line.split('; ')[1]), output)
+            self.assertNotIn(ap.lang_obj().return_message('contact_added', False, 'Anna'), output)
+        self.assertEqual(list(self.book), [])
+
+    def test_interrupted_run_still_saves(self):
+        def lines():
+            yield 'add contact Anna 0501234567'
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt), ap.redirect_stdout(ap.io.StringIO()):
+            ap.run_batch(lines())
+        self.assertEqual(list(ap.Journal.load_snapshot(ap.PHONEBOOK_FILE)), ['Anna'])
+
+    def test_batch_applies(self):
+        self.run_line('add contact Anna 0501234567; add birthday Anna 17.05.1990')
+        self.assertEqual(str(self.book.data['Anna'].birthday), '17.05.1990')
+
+
+class ServerTest(BookTestCase):
+
+    def exchange(self, requests, one_by_one=False):
+        async def run():
+            ready = asyncio.get_running_loop().create_future()
+            server = ap.PhonebookServer('127.0.0.1', 0)
+            task = asyncio.create_task(server.serve(ready.set_result))
+            port = (await ready).sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            if one_by_one:
+                lines = []
+                for request in requests:
+                    writer.write(json.dumps(request).encode('utf-8') + b'\n')
+                    lines.append(await asyncio.wait_for(reader.readline(), 5))
+            else:
+                writer.write(b''.join(json.dumps(request).encode('utf-8') + b'\n' for request in requests))
+                writer.write_eof()
+                lines = (await reader.read()).splitlines()
+            writer.close()
+            task.cancel()
+            return [json.loads(line) for line in lines]
+        return asyncio.run(run())
+
+    def test_pipelined_read_sees_earlier_write(self):
+        responses = self.exchange([{'id': 1, 'op': 'add_contact', 'args': ['Bob', '0501234567']},
+                                   {'id': 2, 'op': 'get', 'args': ['Bob']},
+                                   {'id': 3, 'op': 'count'},
+                                   {'id': 4, 'op': 'delete_contact', 'args': ['Bob']},
+                                   {'id': 5, 'op': 'count'}])
+        self.assertEqual([response['id'] for response in responses], [1, 2, 3, 4, 5])
+        self.assertTrue(responses[1]['ok'])
+        self.assertEqual([responses[2]['result'], responses[4]['result']], [1, 0])
+
+    def test_bad_arguments(self):
+        responses = self.exchange([{'id': 1, 'op': 'add_contact', 'args': ['Bob']},
+                                   {'id': 2, 'op': 'get', 'args': 'Bob'},
+                                   {'id': 3, 'op': 'near_bd', 'args': ['soon']}])
+        self.assertEqual([response['error'] for response in responses],
+                         ['NotEnoughArguments', 'NotEnoughArguments', 'NotANumberForCountOFRecords'])
+
+    def test_failed_commit_keeps_the_writer_running(self):
+        commit = ap.commit_phonebook
+        calls = []
+
+        def fail_once():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OSError('disk full')
+            commit()
+
+        self.addCleanup(setattr, ap, 'commit_phonebook', commit)
+        ap.commit_phonebook = fail_once
+        responses = self.exchange([{'id': 1, 'op': 'add_contact', 'args': ['Bob', '0501234567']},
+                                   {'id': 2, 'op': 'add_contact', 'args': ['Ann', '0671112233']},
+                                   {'id': 3, 'op': 'count'}], one_by_one=True)
+        self.assertEqual([response.get('error') for response in responses], ['OSError', None, None])
+        self.assertEqual(responses[2]['result'], 2)
+
+
+class SQLiteServerTest(ServerTest):
+    storage = 'sqlite'
+
+
+if __name__ == '__main__':
+    unittest.main()